@@ -3,4 +3,4 @@
 rm -r compare*
 rm -r collision*
 rm -r retransmission*
-rm pickle.txt
+rm -r cache
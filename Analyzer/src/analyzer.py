@@ -1,7 +1,12 @@
 from enum import Enum
 import sys, os
-import matplotlib.pyplot as plt
-from matplotlib import ticker
+import numpy as np
+from paramindex import ParameterIndex
+from render import FigureSpec, renderFigures
+from loader import iterSubData
+from data import calcSweepDistances, COLLISION_BIN_STEP
+from instrument import timed, stage, addCount
+from stats import bootstrapInterval, normalInterval
 
 COLOR_LIST = ['r', 'b', 'g', 'm', 'y', 'k', 'c', 'r', 'b', 'g', 'm', 'y', 'k', 'c']
 STYLE_LIST = ['-', '--', '-.', ':', '-', '--', '-.', ':', '-', '--', '-.', ':', '-']
@@ -10,6 +15,8 @@ class XValue(Enum):
    DISTANCE = 0
    DUPLICATION = 1
    ALL = 2
+   # TRANSITION の YValue の横軸
+   STEP = 3
 
 class YValue(Enum):
     MEAN = 0
@@ -19,6 +26,91 @@ class YValue(Enum):
     RETRANSMISSION_NUM = 4
     COLLISION_TRANSITION = 5
     RETRANSMISSION_TRANSITION = 6
+    ADJUST_NUM = 7
+    FIRST_ADJUST_STEP = 8
+    ADJUST_TX_TRANSITION = 9
+    ADJUST_RX_TRANSITION = 10
+
+# YValue ごとに AllData から読む必要があるデータ
+DATA_KEY_DICT = {
+    YValue.MEAN: "resultData",
+    YValue.MEDIAN: "resultData",
+    YValue.JITTER: "resultData",
+    YValue.COLLISION_NUM: "collisionData",
+    YValue.RETRANSMISSION_NUM: "retransmitData",
+    YValue.COLLISION_TRANSITION: "collisionData",
+    YValue.RETRANSMISSION_TRANSITION: "retransmitData",
+    YValue.ADJUST_NUM: "adjustData",
+    YValue.FIRST_ADJUST_STEP: "adjustData",
+    YValue.ADJUST_TX_TRANSITION: "adjustData",
+    YValue.ADJUST_RX_TRANSITION: "adjustData",
+}
+
+# 信頼区間を求める YValue ごとの (標本を返す AllData のメソッド, 統計量)
+INTERVAL_DICT = {
+    YValue.MEAN: ("getRttSamples", "mean"),
+    YValue.MEDIAN: ("getRttSamples", "median"),
+    YValue.JITTER: ("getRttSamples", "std"),
+    YValue.COLLISION_NUM: ("getCollisionNumSamples", "mean"),
+    YValue.RETRANSMISSION_NUM: ("getRetransmissionNumSamples", "mean"),
+    YValue.ADJUST_NUM: ("getAdjustNumSamples", "mean"),
+    YValue.FIRST_ADJUST_STEP: ("getFirstAdjustStepSamples", "mean"),
+}
+INTERVAL_CONFIDENCE = 0.95
+# TRANSITION の曲線を数える step 幅
+TRANSITION_BIN_STEP = COLLISION_BIN_STEP
+TRANSITION_Y_VALUE_LIST = [YValue.COLLISION_TRANSITION, YValue.RETRANSMISSION_TRANSITION,
+                           YValue.ADJUST_TX_TRANSITION, YValue.ADJUST_RX_TRANSITION]
+
+
+class GraphJob:
+    # 描く図の種類. kind が "specific" なら drawSpecificGraph と同じ引数を持つ
+    # "retransmission", "collision" は設定ごとの図
+    def __init__(self, kind, xValue=None, yValue=None, labelValue=None, classifyValue=XValue.ALL, isInterval=False):
+        self.kind = kind
+        self.xValue = xValue
+        self.yValue = yValue
+        self.labelValue = labelValue
+        self.classifyValue = classifyValue
+        self.isInterval = isInterval
+
+    def getKey(self):
+        return (self.kind, self.xValue, self.yValue, self.labelValue, self.classifyValue, self.isInterval)
+
+    def getDataKeyList(self):
+        if self.kind == "retransmission":
+            return ["retransmitData"]
+        elif self.kind == "collision":
+            return ["collisionData"]
+        return [DATA_KEY_DICT[self.yValue]]
+
+    def getValueList(self):
+        # ParameterIndex で計算する値
+        if self.kind != "specific":
+            return []
+        valueList = [self.yValue, self.labelValue]
+        if self.xValue is not XValue.STEP:
+            valueList.append(self.xValue)
+        if self.classifyValue is not XValue.ALL:
+            valueList.append(self.classifyValue)
+        return valueList
+
+
+# drawGraph で描く図. 描かない図はコメントにする
+DEFAULT_JOB_LIST = [
+    # GraphJob("specific", XValue.DISTANCE, YValue.MEAN, XValue.DUPLICATION, XValue.ALL),
+    # GraphJob("specific", XValue.DUPLICATION, YValue.MEDIAN, XValue.DISTANCE, XValue.ALL),
+    # GraphJob("specific", XValue.DISTANCE, YValue.JITTER, XValue.DUPLICATION, XValue.ALL),
+    # GraphJob("retransmission"),
+    # GraphJob("collision"),
+    # GraphJob("specific", XValue.STEP, YValue.COLLISION_TRANSITION, XValue.DUPLICATION, XValue.DISTANCE, True),
+    # GraphJob("specific", XValue.STEP, YValue.RETRANSMISSION_TRANSITION, XValue.DUPLICATION, XValue.DISTANCE, True),
+    # GraphJob("specific", XValue.DISTANCE, YValue.ADJUST_NUM, XValue.DUPLICATION, XValue.ALL, True),
+    # GraphJob("specific", XValue.DISTANCE, YValue.FIRST_ADJUST_STEP, XValue.DUPLICATION, XValue.ALL, True),
+    # GraphJob("specific", XValue.STEP, YValue.ADJUST_TX_TRANSITION, XValue.DUPLICATION, XValue.DISTANCE, True),
+    GraphJob("specific", XValue.DISTANCE, YValue.COLLISION_NUM, XValue.DUPLICATION, XValue.ALL, True),
+    GraphJob("specific", XValue.DISTANCE, YValue.RETRANSMISSION_NUM, XValue.DUPLICATION, XValue.ALL, True),
+]
 
 
 # class Mode(Enum):
@@ -27,10 +119,32 @@ class YValue(Enum):
 
 
 class Analyzer:
-    def __init__(self, dataDict, allFileList):
+    def __init__(self, dataDict, allFileList, workerNum=None, evictData=False):
         print("Analyze Datas")
         self.dataDict = dataDict
         self.allFileList = allFileList
+        self.workerNum = workerNum
+        # True なら図を描き終わるたびに読んだ結果をメモリから捨てる
+        self.evictData = evictData
+        self.index = ParameterIndex(dataDict, allFileList, self.getValue, self.getBatchValue)
+        self.intervalDict = {}
+
+    @timed("analyzer.prepareData")
+    def prepareData(self, key):
+        # まだ読んでいない結果ファイルをまとめて並列に読む
+        readFileList = [fileName for fileName in self.allFileList
+                        if not self.dataDict[fileName].isLoaded(key) and not self.dataDict[fileName].isStored(key)]
+        count = 1
+        for fileName, data in iterSubData(self.dataDict, readFileList, key, self.workerNum):
+            print("{} / {} - {} {} read".format(count, len(readFileList), fileName.split("/")[-1], key))
+            self.dataDict[fileName].setSubData(key, data)
+            count += 1
+
+    def releaseData(self, key):
+        if not self.evictData:
+            return
+        for fileName in self.allFileList:
+            self.dataDict[fileName].evict([key])
 
     def getValue(self, data, value):
         if value is XValue.DISTANCE:
@@ -47,10 +161,45 @@ class Analyzer:
             return data.getCollisionNum()
         elif value is YValue.RETRANSMISSION_NUM:
             return data.getRetransmissionNum()
+        elif value is YValue.COLLISION_TRANSITION:
+            return data.getCollisionTransition(TRANSITION_BIN_STEP)
+        elif value is YValue.RETRANSMISSION_TRANSITION:
+            return data.getRetransmissionTransition(TRANSITION_BIN_STEP)
+        elif value is YValue.ADJUST_NUM:
+            return data.getAdjustNum()
+        elif value is YValue.FIRST_ADJUST_STEP:
+            return data.getFirstAdjustStep()
+        elif value is YValue.ADJUST_TX_TRANSITION:
+            return data.getAdjustTxTransition(TRANSITION_BIN_STEP)
+        elif value is YValue.ADJUST_RX_TRANSITION:
+            return data.getAdjustRxTransition(TRANSITION_BIN_STEP)
         else:
             print("Not Define {} in getValue".format(value.name))
             sys.exit(1)
 
+    def getBatchValue(self, dataList, value):
+        if value is XValue.DISTANCE:
+            return calcSweepDistances(dataList).tolist()
+        return None
+
+    def getInterval(self, fileName, yValue):
+        if yValue not in INTERVAL_DICT:
+            print("Not Define {} in getInterval".format(yValue.name))
+            sys.exit(1)
+        key = (fileName, yValue)
+        if key not in self.intervalDict:
+            data = self.dataDict[fileName]
+            methodName, statName = INTERVAL_DICT[yValue]
+            samples = getattr(data, methodName)()
+            if samples is not None:
+                self.intervalDict[key] = bootstrapInterval(samples, statName, INTERVAL_CONFIDENCE, workerNum=self.workerNum)
+            elif statName == "mean":
+                # streaming で標本が無い時は平均だけ正規近似で求める
+                self.intervalDict[key] = normalInterval(data.getMean(), data.getJitter(), data.resultData.stats.count, INTERVAL_CONFIDENCE)
+            else:
+                self.intervalDict[key] = (np.nan, np.nan)
+        return self.intervalDict[key]
+
     def getLabel(self, data, value):
         if value is XValue.DISTANCE:
             return "d={}".format(data.getDistance())
@@ -64,54 +213,50 @@ class Analyzer:
         if labelValue is XValue.ALL:
             return [self.allFileList]
 
-        labels = []
-
-        # make labels
-        for fileName in fileList:
-            data = self.dataDict[fileName]
-            label = self.getValue(data, labelValue)
-
-            if label in labels:
-                pass
-            else:
-                labels.append(label)
-
-        classifyFiles = [[] for i in range(len(labels))]
-
-        for fileName in fileList:
-            data = self.dataDict[fileName]
-            label = self.getValue(data, labelValue)
-            for i in range(len(labels)):
-                if labels[i] == label:
-                    classifyFiles[i].append(fileName)
-
-        return classifyFiles
+        return list(self.index.groupBy([labelValue], fileList).values())
 
+    @timed("aggregate.getLabelValues")
     def getLabelValues(self, xValue, yValue, labelValue, fileList):
-        X = []
-        labels = []
+        X = self.index.getValues(xValue, fileList)
+        groups = self.index.groupBy([labelValue], fileList)
 
-        for fileName in fileList:
-            data = self.dataDict[fileName]
-            x = self.getValue(data, xValue)
-            label = self.getLabel(data, labelValue)
-            if not x in X:
-                X.append(x)
-            if not label in labels:
-                labels.append(label)
-
-        Y = [[] for i in range(len(labels))]
-        for fileName in fileList:
-            data = self.dataDict[fileName]
-            y = self.getValue(data, yValue)
-            label = self.getLabel(data, labelValue)
-            for i in range(len(labels)):
-                if label == labels[i]:
-                    Y[i].append(y)
-                    continue
+        # 結果が揃っていない組み合わせは nan にして線を切る
+        labels = []
+        Y = []
+        for files in groups.values():
+            labels.append(self.getLabel(self.dataDict[files[0]], labelValue))
+            valueDict = {self.index.getValue(fileName, xValue): self.index.getValue(fileName, yValue) for fileName in files}
+            Y.append([valueDict.get(x, np.nan) for x in X])
 
         return [X, Y, labels]
 
+    @timed("aggregate.getLabelIntervals")
+    def getLabelIntervals(self, xValue, yValue, labelValue, fileList):
+        # getLabelValues の Y と同じ並びで (下限, 上限) を返す
+        X = self.index.getValues(xValue, fileList)
+        groups = self.index.groupBy([labelValue], fileList)
+
+        intervals = []
+        for files in groups.values():
+            intervalDict = {self.index.getValue(fileName, xValue): self.getInterval(fileName, yValue) for fileName in files}
+            lower = [intervalDict.get(x, (np.nan, np.nan))[0] for x in X]
+            upper = [intervalDict.get(x, (np.nan, np.nan))[1] for x in X]
+            intervals.append((lower, upper))
+
+        return intervals
+
+    @timed("aggregate.getLabelCurves")
+    def getLabelCurves(self, yValue, labelValue, fileList):
+        # 設定ごとの TRANSITION の曲線. 横軸は一番長い曲線に合わせる
+        curves = [self.index.getValue(fileName, yValue) for fileName in fileList]
+        binNum = max(len(curve.X) for curve in curves)
+        curves = [curve.pad(binNum) for curve in curves]
+
+        labels = [self.getLabel(self.dataDict[fileName], labelValue) for fileName in fileList]
+        Y = [curve.mean for curve in curves]
+        intervals = [(curve.lower, curve.upper) for curve in curves]
+        return [curves[0].X, Y, labels, intervals]
+
     def defineDirectoryPath(self, xValue, yValue, classifyValue):
         dirPath = "../compare_{}_by_{}".format(yValue.name, xValue.name)
         if classifyValue is not XValue.ALL:
@@ -141,6 +286,8 @@ class Analyzer:
             return "Tx-Rx distance(um)"
         if xValue is XValue.DUPLICATION:
             return "Duplication level (n)"
+        if xValue is XValue.STEP:
+            return "Steps (s)"
         else:
             print("Not define {} in defineXlabel".format(xValue.name))
             sys.exit(1)
@@ -156,106 +303,169 @@ class Analyzer:
             return "Retransmission Num"
         elif yValue is YValue.COLLISION_NUM:
             return "Collision Num"
+        elif yValue is YValue.COLLISION_TRANSITION:
+            return "Collision Num per {} steps".format(TRANSITION_BIN_STEP)
+        elif yValue is YValue.RETRANSMISSION_TRANSITION:
+            return "Retransmission Num per {} steps".format(TRANSITION_BIN_STEP)
+        elif yValue is YValue.ADJUST_NUM:
+            return "Adjustment Num"
+        elif yValue is YValue.FIRST_ADJUST_STEP:
+            return "First adjustment (s)"
+        elif yValue is YValue.ADJUST_TX_TRANSITION:
+            return "Tx molecule Num"
+        elif yValue is YValue.ADJUST_RX_TRANSITION:
+            return "Rx molecule Num"
         else:
             print("Not define {} in defineYlabel".format(yValue.name))
             sys.exit(1)
 
 
-    def drawLineGraph(self, X, Y, labels, xValue, yValue, isMath, figName):
+    def createLineGraphSpec(self, X, Y, labels, xValue, yValue, isMath, figName, intervals=None):
+        spec = FigureSpec(figName, self.defineXlabel(xValue), self.defineYlabel(yValue))
         for i in range(len(Y)):
-            plt.plot(X, Y[i], color=COLOR_LIST[i], label=labels[i], markersize="5", linestyle=STYLE_LIST[i])
+            band = None if intervals is None else intervals[i]
+            spec.addLine(X, Y[i], COLOR_LIST[i], STYLE_LIST[i], labels[i], band)
 
         if xValue is XValue.DISTANCE:
-            plt.xticks(X)
-            plt.legend(loc='upper left')
+            spec.xticks = X
+            spec.legendLoc = 'upper left'
         elif xValue is XValue.DUPLICATION:
-            plt.xticks(X)
-            plt.legend(loc='upper right')
+            spec.xticks = X
+            spec.legendLoc = 'upper right'
+        elif xValue is XValue.STEP:
+            spec.legendLoc = 'upper right'
         else:
             print("Not define {} in drawLineGraph".format(xValue.name))
             sys.exit(1)
 
-        plt.xlabel(self.defineXlabel(xValue))
-        plt.ylabel(self.defineYlabel(yValue))
-        plt.grid(True)
+        spec.isMath = isMath
 
-        if isMath:
-            plt.gca().yaxis.set_major_formatter(ticker.ScalarFormatter(useMathText=True))
-            plt.gca().ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
+        return spec
 
-        plt.savefig(figName)
-        plt.close('all')
+    @timed("render.renderFigures")
+    def renderFigures(self, specList):
+        for figName, isRendered in renderFigures(specList, self.workerNum):
+            if isRendered:
+                addCount("render.renderFigures", figures=1)
+                print("Make figure {}".format(figName))
+            else:
+                print("Skip figure {} (unchanged)".format(figName))
 
-    def drawSpecificGraph(self, xValue, yValue, labelValue, classifyValue):
+    def createSpecificGraphSpecs(self, xValue, yValue, labelValue, classifyValue, isInterval=False):
         dirName = self.defineDirectoryPath(xValue, yValue, classifyValue)
         print("Make figure in {}".format(dirName))
         # グラフことにファイル名を分ける
         classifyFileList = self.classifyDataFile(self.allFileList, classifyValue)
 
+        specList = []
         for fileList in classifyFileList:
             figName = dirName + "/" + self.defineFigName(classifyValue, self.dataDict[fileList[0]])
-            print("Make figure {}".format(figName))
-            X, Y, labels = self.getLabelValues(xValue, yValue, labelValue, fileList)
+            # isInterval なら信頼区間 (TRANSITION は run 間の percentile) を帯で描く
+            if (xValue is XValue.STEP) != (yValue in TRANSITION_Y_VALUE_LIST):
+                print("Not Define {} by {} in createSpecificGraphSpecs".format(yValue.name, xValue.name))
+                sys.exit(1)
+            elif xValue is XValue.STEP:
+                X, Y, labels, intervals = self.getLabelCurves(yValue, labelValue, fileList)
+                if not isInterval:
+                    intervals = None
+            else:
+                X, Y, labels = self.getLabelValues(xValue, yValue, labelValue, fileList)
+                intervals = None
+                if isInterval:
+                    intervals = self.getLabelIntervals(xValue, yValue, labelValue, fileList)
+            if not np.any(np.isfinite(Y)):
+                # adjust_batch_ が無い時など, 描く値が無い
+                print("Skip {} (no data)".format(figName))
+                continue
             isMath = False
-            if max(max(Y)) > 10 ** 5:
+            if np.nanmax(Y) > 10 ** 5:
                 isMath = True
 
-            self.drawLineGraph(X, Y, labels, xValue, yValue, isMath, figName)
-        print("Finish making figure in {}".format(dirName))
+            specList.append(self.createLineGraphSpec(X, Y, labels, xValue, yValue, isMath, figName, intervals))
 
-    def drawRetransmissionGraph(self):
+        return specList
+
+    def createRetransmissionGraphSpecs(self):
         dirName = "../retransmission_each_simulation"
         if not os.path.isdir(dirName):
             os.makedirs(dirName)
         print("Make figure in {}".format(dirName))
 
+        specList = []
         for fileName in self.allFileList:
             data = self.dataDict[fileName]
             figName = dirName + "/" + data.datData.config["outputFile"].strip().split(".")[0] + ".png"
-            print("Make figure {}".format(figName))
 
             X, Y = data.getRetransmissionPlotData()
 
-            plt.plot(X, Y, color=COLOR_LIST[0], markersize="5", linestyle=STYLE_LIST[0])
+            spec = FigureSpec(figName, "Steps (s)", "Retransmit Num")
+            spec.addLine(X, Y, COLOR_LIST[0], STYLE_LIST[0])
+            specList.append(spec)
 
-            plt.xlabel("Steps (s)")
-            plt.ylabel("Retransmit Num")
-            plt.grid(True)
+        return specList
 
-            plt.savefig(figName)
-            plt.close('all')
-
-        print("Finish making figure in {}".format(dirName))
-
-    def drawCollisionGraph(self):
+    def createCollisionGraphSpecs(self):
         dirName = "../collision_each_simulation"
         if not os.path.isdir(dirName):
             os.makedirs(dirName)
         print("Make figure in {}".format(dirName))
 
+        specList = []
         for fileName in self.allFileList:
             data = self.dataDict[fileName]
             figName = dirName + "/" + data.datData.config["outputFile"].strip().split(".")[0] + ".png"
-            print("Make figure {}".format(figName))
 
             X, Y = data.getCollisionPlotData()
 
-            plt.plot(X, Y, color=COLOR_LIST[0], markersize="5", linestyle=STYLE_LIST[0])
+            spec = FigureSpec(figName, "Steps (s)", "Collision Num")
+            spec.addLine(X, Y, COLOR_LIST[0], STYLE_LIST[0])
+            specList.append(spec)
+
+        return specList
 
-            plt.xlabel("Steps (s)")
-            plt.ylabel("Collision Num")
-            plt.grid(True)
+    def createJobSpecs(self, job):
+        if job.kind == "specific":
+            return self.createSpecificGraphSpecs(job.xValue, job.yValue, job.labelValue, job.classifyValue, job.isInterval)
+        elif job.kind == "retransmission":
+            return self.createRetransmissionGraphSpecs()
+        elif job.kind == "collision":
+            return self.createCollisionGraphSpecs()
+        else:
+            print("Not Define {} in createJobSpecs".format(job.kind))
+            sys.exit(1)
 
-            plt.savefig(figName)
-            plt.close('all')
+    @timed("draw.drawSpecificGraph")
+    def drawSpecificGraph(self, xValue, yValue, labelValue, classifyValue, isInterval=False):
+        self.runJobs([GraphJob("specific", xValue, yValue, labelValue, classifyValue, isInterval)])
 
-        print("Finish making figure in {}".format(dirName))
+    @timed("draw.drawRetransmissionGraph")
+    def drawRetransmissionGraph(self):
+        self.runJobs([GraphJob("retransmission")])
 
-    def drawGraph(self):
-        # self.drawSpecificGraph(XValue.DISTANCE, YValue.MEAN, XValue.DUPLICATION, XValue.ALL)
-        # self.drawSpecificGraph(XValue.DUPLICATION, YValue.MEDIAN, XValue.DISTANCE, XValue.ALL)
-        # self.drawSpecificGraph(XValue.DISTANCE, YValue.JITTER, XValue.DUPLICATION, XValue.ALL)
-        # self.drawRetransmissionGraph()
-        # self.drawCollisionGraph()
-        self.drawSpecificGraph(XValue.DISTANCE, YValue.COLLISION_NUM, XValue.DUPLICATION, XValue.ALL)
-        self.drawSpecificGraph(XValue.DISTANCE, YValue.RETRANSMISSION_NUM, XValue.DUPLICATION, XValue.ALL)
\ No newline at end of file
+    @timed("draw.drawCollisionGraph")
+    def drawCollisionGraph(self):
+        self.runJobs([GraphJob("collision")])
+
+    @timed("draw.runJobs")
+    def runJobs(self, jobList):
+        # 必要な結果は種類ごとに一度だけ読み, 値も設定ごとに一度だけ計算して全ての job で共有する
+        # 図は最後にまとめて描く
+        jobList = list({job.getKey(): job for job in jobList}.values())
+        keyList = list(dict.fromkeys(key for job in jobList for key in job.getDataKeyList()))
+        for key in keyList:
+            self.prepareData(key)
+        with stage("aggregate.extractValues"):
+            for value in dict.fromkeys(value for job in jobList for value in job.getValueList()):
+                self.index.getValueDict(value)
+
+        specList = []
+        for job in jobList:
+            specList += self.createJobSpecs(job)
+        for key in keyList:
+            self.releaseData(key)
+
+        self.renderFigures(specList)
+        print("Finish making {} figures for {} jobs".format(len(specList), len(jobList)))
+
+    def drawGraph(self, jobList=None):
+        self.runJobs(DEFAULT_JOB_LIST if jobList is None else jobList)
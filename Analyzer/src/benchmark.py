@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+import numpy as np
+from data import COLLISION_BIN_STEP, countInBins, AllData, DatData, ResultData, CollisionData, RetransmitData, AdjustData
+from synthetic import generateSweep
+
+RESULT_FILE = '../benchmark_results.jsonl'
+
+
+def legacyCollisionPlotData(y, step):
+    X = np.arange(0, np.max(y) + step, step, dtype=int)
+    Y = []
+    for i in range(len(X) - 1):
+        start = X[i]
+        end = X[i + 1]
+        tmp = [j for j in y if j > start and j <= end]
+        Y.append(len(tmp))
+    Y.append(0)
+    return X, Y
+
+
+def legacyRetransmitNumData(retransmitNum):
+    retransmitNumData = []
+    for i in range(np.max(retransmitNum) + 1):
+        num = len([j for j in retransmitNum if i == j])
+        retransmitNumData.append(num)
+    return retransmitNumData
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def benchHistogram(collisionNum=200000, maxStep=100000, runNum=1000, seed=0):
+    rng = np.random.default_rng(seed)
+
+    y = np.sort(rng.integers(1, maxStep, collisionNum))
+    X = np.arange(0, np.max(y) + COLLISION_BIN_STEP, COLLISION_BIN_STEP, dtype=int)
+    (legacyX, legacyY), legacyTime = measure(legacyCollisionPlotData, y, COLLISION_BIN_STEP)
+    Y, newTime = measure(countInBins, y, X)
+    if not np.array_equal(legacyX, X) or list(legacyY) != list(Y):
+        print("Collision histogram does not match legacy result")
+        sys.exit(1)
+    print("collision histogram: legacy {:.3f}s, bincount {:.5f}s, x{:.0f}".format(legacyTime, newTime, legacyTime / newTime))
+
+    retransmitNum = np.sort(rng.poisson(3, runNum))
+    legacyY, legacyTime = measure(legacyRetransmitNumData, retransmitNum)
+    Y, newTime = measure(np.bincount, retransmitNum)
+    if list(legacyY) != list(Y):
+        print("Retransmission histogram does not match legacy result")
+        sys.exit(1)
+    print("retransmission histogram: legacy {:.3f}s, bincount {:.5f}s, x{:.0f}".format(legacyTime, newTime, legacyTime / newTime))
+
+
+def parseSubData(dataClass, datDataDict):
+    return {fileName: dataClass(datData.config["outputFile"].strip()) for fileName, datData in datDataDict.items()}
+
+
+def aggregate(allFileList, subDataDict):
+    from analyzer import Analyzer, XValue, YValue
+    dataDict = {}
+    for fileName in allFileList:
+        dataDict[fileName] = AllData(fileName)
+        for key in subDataDict:
+            dataDict[fileName].setSubData(key, subDataDict[key][fileName])
+
+    analyzer = Analyzer(dataDict, allFileList, 1)
+    for yValue in [YValue.MEAN, YValue.MEDIAN, YValue.JITTER, YValue.COLLISION_NUM, YValue.RETRANSMISSION_NUM]:
+        analyzer.getLabelValues(XValue.DISTANCE, yValue, XValue.DUPLICATION, allFileList)
+    for fileName in allFileList:
+        dataDict[fileName].getCollisionPlotData()
+        dataDict[fileName].getRetransmissionPlotData()
+    return analyzer
+
+
+def render(analyzer):
+    from analyzer import XValue, YValue
+    for dirName in ["../compare_mean_by_distance", "../collision_each_simulation"]:
+        if os.path.isdir(dirName):
+            shutil.rmtree(dirName)
+    analyzer.drawSpecificGraph(XValue.DISTANCE, YValue.MEAN, XValue.DUPLICATION, XValue.ALL)
+    analyzer.drawCollisionGraph()
+
+
+def runStage(stageList, name, func, isMemory):
+    # 時間は tracemalloc なしで測り, peak memory は別にもう一度実行して測る
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result, seconds = measure(func)
+        peak = None
+        if isMemory:
+            tracemalloc.start()
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    stageList.append({"stage": name, "seconds": seconds, "peakMB": None if peak is None else peak / 1024 / 1024})
+    print("{:<22} {:>9.3f}s {}".format(name, seconds, "" if peak is None else "{:>9.1f}MB".format(peak / 1024 / 1024)))
+    return result
+
+
+def benchPipeline(configNum, runNum, stepNum, isMemory=True, seed=0):
+    workDir = tempfile.mkdtemp(prefix="molcom_bench_")
+    currentDir = os.getcwd()
+    try:
+        generateSweep(workDir, configNum, runNum, stepNum, seed)
+        # data.py は ../result を読むので workDir/run から実行する
+        os.makedirs(os.path.join(workDir, "run"))
+        os.chdir(os.path.join(workDir, "run"))
+        allFileList = sorted(os.path.join("../dat", name) for name in os.listdir("../dat"))
+
+        stageList = []
+        datDataDict = runStage(stageList, "parse_dat", lambda: {fileName: DatData(fileName) for fileName in allFileList}, isMemory)
+        subDataDict = {}
+        for key, dataClass in [("resultData", ResultData), ("collisionData", CollisionData),
+                               ("retransmitData", RetransmitData), ("adjustData", AdjustData)]:
+            subDataDict[key] = runStage(stageList, "parse_" + key, lambda: parseSubData(dataClass, datDataDict), isMemory)
+        analyzer = runStage(stageList, "aggregate", lambda: aggregate(allFileList, subDataDict), isMemory)
+        runStage(stageList, "render", lambda: render(analyzer), isMemory)
+    finally:
+        os.chdir(currentDir)
+        shutil.rmtree(workDir)
+
+    return stageList
+
+
+def getCommit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def loadPreviousResult(resultFileName, scale):
+    previous = None
+    if not os.path.isfile(resultFileName):
+        return None
+    with open(resultFileName, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            if record["scale"] == scale:
+                previous = record
+    return previous
+
+
+def compareResult(previous, stageList):
+    print("compare with {} ({})".format(previous["commit"], previous["date"]))
+    previousDict = {stage["stage"]: stage for stage in previous["stages"]}
+    for stage in stageList:
+        if stage["stage"] not in previousDict:
+            continue
+        ratio = stage["seconds"] / max(previousDict[stage["stage"]]["seconds"], 1e-9)
+        print("{:<22} {:>9.3f}s -> {:>9.3f}s  x{:.2f}".format(stage["stage"], previousDict[stage["stage"]]["seconds"], stage["seconds"], ratio))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, aggregation and rendering on a synthetic sweep")
+    parser.add_argument("--configs", type=int, default=12, help="number of dat files")
+    parser.add_argument("--runs", type=int, default=1000, help="batch runs per dat file")
+    parser.add_argument("--steps", type=int, default=200, help="mean collision steps per run")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", default=RESULT_FILE, help="JSON lines file to append results to")
+    parser.add_argument("--histogram", action="store_true", help="only run the histogram benchmark")
+    args = parser.parse_args()
+
+    if args.histogram:
+        benchHistogram()
+        return
+
+    scale = {"configs": args.configs, "runs": args.runs, "steps": args.steps}
+    print("configs={configs} runs={runs} steps={steps}".format(**scale))
+    stageList = benchPipeline(args.configs, args.runs, args.steps, not args.no_memory)
+
+    previous = loadPreviousResult(args.output, scale)
+    if previous is not None:
+        compareResult(previous, stageList)
+
+    record = {"commit": getCommit(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "scale": scale, "stages": stageList}
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import pickle
+import shutil
+from stamp import FileStamp, calcFileHash
+from data import AllData, RESULT_DIR, RESULT_PREFIX_LIST, STORE_DATA_LIST
+
+CACHE_DIR = '../cache'
+INDEX_FILE = 'index.pickle'
+# data.py のクラス構成を変えたら上げる
+CACHE_VERSION = 16
+
+
+def getSourceFileList(datFileName, outputFileName):
+    return [datFileName] + [RESULT_DIR + prefix + outputFileName for prefix in RESULT_PREFIX_LIST]
+
+
+class DataCache:
+    def __init__(self, cacheDir=CACHE_DIR, options=None):
+        self.cacheDir = cacheDir
+        # 読み込み方法が違う entry は使わない
+        self.options = options or {}
+        self.indexFileName = os.path.join(cacheDir, INDEX_FILE)
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.loadIndex()
+
+    def loadIndex(self):
+        self.index = {}
+        if not os.path.isfile(self.indexFileName):
+            return
+        with open(self.indexFileName, 'rb') as f:
+            savedIndex = pickle.load(f)
+        if savedIndex.get("version") == CACHE_VERSION:
+            self.index = savedIndex["entries"]
+            return
+        # 古い形式の cache は読めないので捨てる
+        for entry in savedIndex.get("entries", {}).values():
+            self.removeEntryFile(entry)
+
+    def saveIndex(self):
+        for entry in self.index.values():
+            self.updateSources(entry)
+        with open(self.indexFileName, 'wb') as f:
+            pickle.dump({"version": CACHE_VERSION, "entries": self.index}, f)
+
+    def removeEntryFile(self, entry):
+        if os.path.isdir(entry.get("storeDir", "")):
+            shutil.rmtree(entry["storeDir"])
+        if os.path.isfile(entry.get("cacheFile", "")):
+            os.remove(entry["cacheFile"])
+
+    def defineStoreDir(self, datFileName):
+        return os.path.join(self.cacheDir, os.path.basename(datFileName))
+
+    def isValid(self, datFileName):
+        # dat が変わった時だけ entry ごと捨てる
+        if datFileName not in self.index:
+            return False
+        entry = self.index[datFileName]
+        if entry["options"] != self.options or not os.path.isdir(entry["storeDir"]):
+            return False
+        return self.isSourceSame(entry, "datData")
+
+    def isSourceSame(self, entry, key):
+        if key not in entry["sources"]:
+            return False
+        stamp = entry["sources"][key]
+        return FileStamp(stamp.fileName, withHash=False).isSame(stamp)
+
+    def updateSources(self, entry):
+        # 読む前に取った stamp を使う. 読んだ後に変わったファイルは次に読み直す
+        meta = entry["meta"]
+        for key in ["datData"] + STORE_DATA_LIST:
+            if key in meta and key not in entry["sources"]:
+                entry["sources"][key] = meta[key].sourceStamp if key == "datData" else meta[key]["scalars"]["sourceStamp"]
+
+    def load(self, datFileName):
+        if not self.isValid(datFileName):
+            return None
+        entry = self.index[datFileName]
+        # 変わった結果ファイルの分だけ捨て, 参照された時に読み直す
+        for key in STORE_DATA_LIST:
+            if key in entry["meta"] and not self.isSourceSame(entry, key):
+                del entry["meta"][key]
+                entry["sources"].pop(key, None)
+        return AllData.fromStore(datFileName, entry["storeDir"], entry["meta"], **self.options)
+
+    def store(self, datFileName, data):
+        storeDir = self.defineStoreDir(datFileName)
+        if os.path.isdir(storeDir):
+            shutil.rmtree(storeDir)
+        os.makedirs(storeDir)
+        self.index[datFileName] = {
+            "storeDir": storeDir,
+            "options": self.options,
+            "meta": data.saveStore(storeDir),
+            "sources": {},
+        }
+        self.updateSources(self.index[datFileName])
+
+    def evict(self, allFileList):
+        allFileSet = set(allFileList)
+        for datFileName in list(self.index.keys()):
+            if datFileName in allFileSet and os.path.isfile(datFileName):
+                continue
+            self.removeEntryFile(self.index[datFileName])
+            del self.index[datFileName]
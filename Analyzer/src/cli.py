@@ -0,0 +1,149 @@
+import sys
+import glob
+import json
+import argparse
+import contextlib
+import numpy as np
+from natsort import natsorted
+from analyzer import Analyzer, XValue
+from cache import DataCache
+from table import buildSweepTable, TABLE_X_VALUE_LIST, TABLE_Y_VALUE_LIST
+import main as analyzeMain
+
+# 結果だけを stdout に書き, 読み込みの進捗は stderr に出す
+# matplotlib は plot の時だけ (描画する worker の中で) 読む
+
+
+def parseValue(text):
+    for valueType in [int, float]:
+        try:
+            return valueType(text)
+        except ValueError:
+            continue
+    return text
+
+
+def parseValueName(name, valueList):
+    # 1 設定に 1 つの値になる指標だけ (大文字小文字は区別しない). TRANSITION の曲線は plot で描く
+    name = name.strip().upper()
+    for value in valueList:
+        if value.name == name:
+            return value
+    print("Not Define {} in parseValueName (choose from {})".format(name, ", ".join(value.name for value in valueList)),
+          file=sys.stderr)
+    sys.exit(1)
+
+
+def parseConditions(whereList):
+    # "distance=10" は XValue, それ以外は DatData.config のキー
+    conditions = {}
+    for where in whereList:
+        key, _, value = where.partition("=")
+        if key.strip().upper() in XValue.__members__:
+            conditions[XValue[key.strip().upper()]] = parseValue(value)
+        else:
+            conditions[key.strip()] = parseValue(value)
+    return conditions
+
+
+def createAnalyzer(args):
+    allFileList = natsorted(glob.glob(args.dat))
+    if not allFileList:
+        print("No dat file matches {}".format(args.dat), file=sys.stderr)
+        sys.exit(1)
+    cache = DataCache(options={"streaming": args.streaming, "keepSteps": args.keep_steps})
+    with contextlib.redirect_stdout(sys.stderr):
+        dataDict = analyzeMain.createDataDict(allFileList, cache, args.workers, args.streaming, args.keep_steps)
+        analyzer = Analyzer(dataDict, allFileList, args.workers)
+    return analyzer, cache
+
+
+def toJsonValue(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def printRows(rows, isJson):
+    if isJson:
+        print(json.dumps(rows, default=toJsonValue))
+        return
+    if not rows:
+        return
+    nameList = list(rows[0].keys())
+    print("\t".join(nameList))
+    for row in rows:
+        print("\t".join(str(toJsonValue(row[name])) for name in nameList))
+
+
+def runSummary(args, analyzer):
+    yValueList = [parseValueName(name, TABLE_Y_VALUE_LIST) for name in args.metric] if args.metric else TABLE_Y_VALUE_LIST
+    with contextlib.redirect_stdout(sys.stderr):
+        table = buildSweepTable(analyzer, yValueList)
+    nameList = ["datFile", "distance", "duplication"] + [yValue.name.lower() for yValue in yValueList]
+    rows = [dict(zip(nameList, values)) for values in zip(*[table[name].tolist() for name in nameList])]
+    printRows(rows, args.json)
+
+
+def runQuery(args, analyzer):
+    # 条件に合う設定の結果だけを読む
+    valueList = [parseValueName(name, TABLE_X_VALUE_LIST + TABLE_Y_VALUE_LIST) for name in args.metric]
+    fileList = analyzer.index.filter(parseConditions(args.where))
+    rows = []
+    with contextlib.redirect_stdout(sys.stderr):
+        for fileName in fileList:
+            row = {"datFile": fileName}
+            for value in valueList:
+                row[value.name.lower()] = analyzer.getValue(analyzer.dataDict[fileName], value)
+            rows.append(row)
+    printRows(rows, args.json)
+
+
+def runExport(args, analyzer):
+    yValueList = [parseValueName(name, TABLE_Y_VALUE_LIST) for name in args.metric] if args.metric else TABLE_Y_VALUE_LIST
+    with contextlib.redirect_stdout(sys.stderr):
+        buildSweepTable(analyzer, yValueList).save(args.output)
+    print("Write sweep table to {}".format(args.output), file=sys.stderr)
+
+
+def runPlot(args, analyzer):
+    analyzer.drawGraph(analyzeMain.createJobList(args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query, export and plot cached MolComSim analysis results")
+    parser.add_argument("--dat", default=analyzeMain.DAT_PATH, help="glob of dat files")
+    parser.add_argument("--workers", type=int, default=1, help="processes for parsing files that are not cached (0 = cpu count)")
+    parser.add_argument("--streaming", action="store_true", help="read batch_ files in chunks (approximate median)")
+    parser.add_argument("--keep-steps", action="store_true", help="keep every RTT when streaming (for MEDIAN/JITTER intervals)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summary = subparsers.add_parser("summary", help="print metrics of every dat file")
+    summary.add_argument("--metric", action="append", default=[], help="YValue to print (repeatable, default: all scalar metrics)")
+    summary.add_argument("--json", action="store_true", help="print JSON instead of tab separated text")
+
+    query = subparsers.add_parser("query", help="print metrics of the dat files matching conditions")
+    query.add_argument("metric", nargs="+", help="DISTANCE, DUPLICATION or scalar YValue names, e.g. MEAN COLLISION_NUM")
+    query.add_argument("--where", action="append", default=[], help="condition such as distance=10 or probDRail=0.5 (repeatable)")
+    query.add_argument("--json", action="store_true", help="print JSON instead of tab separated text")
+
+    export = subparsers.add_parser("export", help="write the sweep table (.csv, .npz, .parquet, .feather)")
+    export.add_argument("output", help="output file")
+    export.add_argument("--metric", action="append", default=[], help="YValue to include (repeatable, default: all scalar metrics)")
+
+    plot = subparsers.add_parser("plot", help="draw graphs")
+    plot.add_argument("--jobs", default=None, help="JSON or YAML file listing the graphs to draw")
+    plot.add_argument("--job", action="append", default=[], help="graph to draw as x:y:label[:classify][:interval] (repeatable)")
+
+    args = parser.parse_args()
+    analyzer, cache = createAnalyzer(args)
+    commandDict = {"summary": runSummary, "query": runQuery, "export": runExport, "plot": runPlot}
+    try:
+        commandDict[args.command](args, analyzer)
+    finally:
+        # 読んだ結果は次の実行のために cache に残す
+        cache.saveIndex()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,187 @@
 import numpy as np
 from enum import Enum
 import os, re, sys, math
+from ragged import VALUE_DTYPE, RaggedArray, concatRagged, readLineFields, parseIntFile, parseIntText, parseRaggedField, parseTable
+from stats import RunningStats, QuantileSketch
+from store import saveColumn, loadColumn, isColumnValue
+from stamp import FileStamp
+from instrument import timed, stage, addFileRead
+from timeseries import calcRunHistogram, calcRunLevel, resizeColumns, TransitionCurve
+
+RESULT_DIR = "../result/"
+RESULT_PREFIX_LIST = ["batch_", "adjust_batch_", "collision_batch_", "retransmission_batch_"]
+COLLISION_BIN_STEP = 1000
+# streaming で一度に読む byte 数
+STREAMING_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def countInBins(sortedValues, edges):
+    # (edges[i], edges[i + 1]] に入る個数, 最後の bin は 0
+    counts = np.zeros(len(edges), dtype=int)
+    cumulative = np.searchsorted(sortedValues, edges, side='right')
+    counts[:-1] = np.diff(cumulative)
+    return counts
+
+
+def binHistogram(histogram, binStep, edges):
+    # binStep ごとの histogram から countInBins(steps, edges) と同じ値を作る. edges は binStep の倍数
+    cumulative = np.zeros(len(histogram) + 1, dtype=np.int64)
+    np.cumsum(histogram, out=cumulative[1:])
+    counts = np.zeros(len(edges), dtype=int)
+    counts[:-1] = np.diff(cumulative[np.minimum(edges // binStep, len(histogram))])
+    return counts
+
+
+def addHistogram(histogram, counts):
+    # 長さの違う histogram を足す. 足りない bin は 0 とみなす
+    if len(counts) > len(histogram):
+        histogram, counts = counts, histogram
+    histogram = histogram.astype(np.int64)
+    histogram[:len(counts)] += counts
+    return histogram
+
+
+def countCollisionPerRun(collisionStep):
+    # 衝突が無い run は 0 が 1 つ書かれているので 0 以外を数える
+    isCollision = collisionStep.values != 0
+    return np.bincount(collisionStep.getRowIndex()[isCollision], minlength=len(collisionStep))
+
+
+def countRetransmissionPerRun(lineFields):
+    return np.fromiter((len(datas[1]) - 1 for datas in lineFields), dtype=int, count=len(lineFields))
+
+
+STORE_DATA_LIST = ["resultData", "adjustData", "collisionData", "retransmitData"]
+
+
+def createSubData(key, outputFileName, streaming=False, keepSteps=False):
+    if key == "resultData":
+        return ResultData(outputFileName, streaming, keepSteps)
+    elif key == "adjustData":
+        return AdjustData(outputFileName)
+    elif key == "collisionData":
+        return CollisionData(outputFileName, streaming)
+    elif key == "retransmitData":
+        return RetransmitData(outputFileName)
+    else:
+        print("Not Define {} in createSubData".format(key))
+        sys.exit(1)
+
+
+def calcSweepDistances(dataList):
+    # 全ての設定の Tx-Rx 距離を一度に求める. AllData.getDistance と同じく切り捨てる
+    txArray = np.array([data.getCenterPosition("transmitter") for data in dataList]).reshape(len(dataList), 3)
+    rxArray = np.array([data.getCenterPosition("receiver") for data in dataList]).reshape(len(dataList), 3)
+    return calcDistances(txArray, rxArray).astype(int)
+
 
 class AllData:
-    def __init__(self, fileName):
+    # 結果ファイルは最初に参照された時に読む
+    def __init__(self, fileName, streaming=False, keepSteps=False):
         self.datFileName = fileName
         self.datData = DatData(self.datFileName)
-        outputFileName = self.datData.config["outputFile"].strip()
-        self.resultData = ResultData(outputFileName)
-        self.adjustData = AdjustData(outputFileName)
-        self.collisionData = CollisionData(outputFileName)
-        self.retransmitData = RetransmitData(outputFileName)
+        self.outputFileName = self.datData.config["outputFile"].strip()
+        self.streaming = streaming
+        self.keepSteps = keepSteps
+        self.subDataDict = {}
+        self.storeDir = None
+        self.storeMeta = None
+
+    @property
+    def resultData(self):
+        return self.getSubData("resultData")
+
+    @property
+    def adjustData(self):
+        return self.getSubData("adjustData")
+
+    @property
+    def collisionData(self):
+        return self.getSubData("collisionData")
+
+    @property
+    def retransmitData(self):
+        return self.getSubData("retransmitData")
+
+    def getSubData(self, key):
+        if key not in self.subDataDict:
+            if self.isStored(key):
+                self.subDataDict[key] = self.loadSubData(key)
+            else:
+                self.setSubData(key, createSubData(key, self.outputFileName, self.streaming, self.keepSteps))
+        return self.subDataDict[key]
+
+    def setSubData(self, key, data):
+        self.subDataDict[key] = data
+        if self.storeDir is not None:
+            self.storeMeta[key] = data.saveColumns(self.storeDir)
+
+    def isLoaded(self, key):
+        return key in self.subDataDict
+
+    def isStored(self, key):
+        return self.storeMeta is not None and key in self.storeMeta
+
+    def loadSubData(self, key):
+        dataClassDict = {"resultData": ResultData, "adjustData": AdjustData,
+                         "collisionData": CollisionData, "retransmitData": RetransmitData}
+        data = dataClassDict[key].__new__(dataClassDict[key])
+        data.loadColumns(self.storeDir, self.storeMeta[key])
+        return data
+
+    def evict(self, keyList=None):
+        # store に保存済みなら次に参照された時に読み直す
+        for key in (STORE_DATA_LIST if keyList is None else keyList):
+            self.subDataDict.pop(key, None)
+
+    def saveStore(self, dirName):
+        # 以降に読んだ結果も dirName に保存し, 返した meta に追記する
+        self.storeDir = dirName
+        self.storeMeta = {"datData": self.datData}
+        for key, data in self.subDataDict.items():
+            self.storeMeta[key] = data.saveColumns(dirName)
+        return self.storeMeta
+
+    def detachStore(self):
+        # 全ての結果を読み込み, 元の store に書き込まないようにする
+        for key in STORE_DATA_LIST:
+            self.getSubData(key).detachStore()
+        self.storeDir = None
+        self.storeMeta = None
+
+    def merge(self, other):
+        # 同じ設定の別の run の結果を後ろに足す. 結果ファイルが両方に無いものはそのまま
+        for key in STORE_DATA_LIST:
+            data = self.getSubData(key)
+            otherData = other.getSubData(key)
+            if data.fileExists != otherData.fileExists:
+                print("Cannot merge {} of {}: the result file exists on only one side".format(key, self.datFileName))
+                sys.exit(1)
+            if data.fileExists:
+                data.merge(otherData)
+        return self
+
+    @classmethod
+    def fromStore(cls, fileName, dirName, meta, streaming=False, keepSteps=False):
+        allData = cls.__new__(cls)
+        allData.datFileName = fileName
+        allData.datData = meta["datData"]
+        allData.outputFileName = allData.datData.config["outputFile"].strip()
+        allData.streaming = streaming
+        allData.keepSteps = keepSteps
+        allData.subDataDict = {}
+        allData.storeDir = dirName
+        allData.storeMeta = meta
+        return allData
 
     def getDistance(self):
         txPos = self.datData.config["transmitter"].centerPosition
         rxPos = self.datData.config["receiver"].centerPosition
         return int(txPos.calcDistance(rxPos))
 
+    def getCenterPosition(self, key):
+        return self.datData.config[key].centerPosition.getKey()
+
     def getMean(self):
         return self.resultData.mean_
 
@@ -38,37 +203,89 @@ class AllData:
 
         return X, Y
 
-    def getCollisionPlotData(self):
-        y = self.collisionData.collisionNumData
-        yMax = np.max(y)
-        step = 1000
-        X = np.arange(0, yMax + step, step, dtype=int)
-        Y = []
-
-        for i in range(len(X) - 1):
-            start = X[i]
-            end = X[i + 1]
-            tmp = [j for j in y if j > start and j <= end]
-            Y.append(len(tmp))
-        Y.append(0)
+    def getCollisionPlotData(self, step=COLLISION_BIN_STEP, maxStep=None):
+        collisionData = self.collisionData
+        if maxStep is None:
+            maxStep = collisionData.collisionMaxStep
+        X = np.arange(0, maxStep + step, step, dtype=int)
+        # step が histogram の bin 幅の倍数なら全ての step を読まずに数える
+        if step % collisionData.collisionBinStep == 0:
+            Y = binHistogram(collisionData.collisionHistogram, collisionData.collisionBinStep, X)
+        else:
+            collisionData.checkStepData(step, "getCollisionPlotData")
+            Y = countInBins(collisionData.collisionNumData, X)
 
         return X, Y
 
     def getCollisionNum(self):
-        return self.collisionData.collisionSum / len(self.collisionData.collisionStep)
+        # collision_batch_ が無いか run が無ければ nan
+        collisionData = self.collisionData
+        if not collisionData.fileExists or collisionData.collisionRunNum == 0:
+            return np.nan
+        return collisionData.collisionSum / collisionData.collisionRunNum
+
+    def getRttSamples(self):
+        # streaming で steps を残していない場合は None
+        if self.resultData.streaming and not hasattr(self.resultData, "steps"):
+            return None
+        return self.resultData.steps
+
+    def getCollisionNumSamples(self):
+        if not self.collisionData.fileExists:
+            return np.zeros(0, dtype=VALUE_DTYPE)
+        return self.collisionData.collisionPerRun
+
+    def getRetransmissionNumSamples(self):
+        if not self.retransmitData.fileExists:
+            return np.zeros(0, dtype=VALUE_DTYPE)
+        return self.retransmitData.retransmitNum
 
     def getRetransmissionNum(self):
-        return sum(self.retransmitData.retransmitNum) / len(self.retransmitData.retransmitStep)
+        # retransmission_batch_ が無いか run が無ければ nan
+        samples = self.getRetransmissionNumSamples()
+        return np.sum(samples) / len(samples) if len(samples) > 0 else np.nan
+
+    def getAdjustNumSamples(self):
+        return self.adjustData.adjustStep.getLengths()
+
+    def getAdjustNum(self):
+        samples = self.getAdjustNumSamples()
+        return np.mean(samples) if len(samples) > 0 else np.nan
+
+    def getFirstAdjustStepSamples(self):
+        # 一度も調整しなかった run は含めない
+        adjustStep = self.adjustData.adjustStep
+        return adjustStep.values[adjustStep.offsets[:-1][adjustStep.getLengths() > 0]]
+
+    def getFirstAdjustStep(self):
+        samples = self.getFirstAdjustStepSamples()
+        return np.mean(samples) if len(samples) > 0 else np.nan
+
+    def getAdjustTxTransition(self, binStep=COLLISION_BIN_STEP):
+        adjustData = self.adjustData
+        return TransitionCurve(calcRunLevel(adjustData.adjustStep, adjustData.adjustNumTx, binStep), binStep, isLevel=True)
+
+    def getAdjustRxTransition(self, binStep=COLLISION_BIN_STEP):
+        adjustData = self.adjustData
+        return TransitionCurve(calcRunLevel(adjustData.adjustStep, adjustData.adjustNumRx, binStep), binStep, isLevel=True)
+
+    def getCollisionTransition(self, binStep=COLLISION_BIN_STEP):
+        return TransitionCurve(self.collisionData.getRunHistogram(binStep), binStep)
+
+    def getRetransmissionTransition(self, binStep=COLLISION_BIN_STEP):
+        return TransitionCurve(calcRunHistogram(self.retransmitData.retransmitTxStep, binStep), binStep)
 
 class DatData:
+    @timed("parse.DatData")
     def __init__(self, fileName):
         self.fileName = fileName
+        self.sourceStamp = FileStamp(fileName)
         self.parseFile()
 
     def parseFile(self):
         self.config = {}
         self.config["moleculeParams"] = []
-        self.config["microtubuleParams"] = []
+        microtubuleRowList = []
         with open(self.fileName, 'r') as f:
             for line in f:
                 if line[0] == '*' or line[0] == '\n':
@@ -81,7 +298,7 @@ class DatData:
                 elif key in ["moleculeParams"]:
                     self.config[key].append(MoleculeParams(val))
                 elif key in ["microtubuleParams"]:
-                    self.config[key].append(MicrotubuleParams(val))
+                    microtubuleRowList.append([int(i) for i in splitArgs(val)[0:6]])
                 elif key in ["probDRail", "stepLengthX", "stepLengthY", "stepLengthZ",
                              "packetStepLengthX", "packetStepLengthY", "packetStepLengthZ",
                              "packetDiameter"]:
@@ -92,42 +309,114 @@ class DatData:
                     self.config[key] = FEC(val)
                 else:
                     self.config[key] = int(val)
-
-
-class AdjustData:
+        self.config["microtubuleParams"] = MicrotubuleArray(microtubuleRowList)
+        addFileRead("parse.DatData", self.fileName, len(self.config))
+
+
+class ColumnData:
+    # 配列の属性は store に列として保存し, 最初に参照された時に読む
+    # 結果ファイルが無くてもよいクラスは, 無ければ fileExists を False にする
+    # sourceStamp は読む前に取った結果ファイルの stamp で, cache はこれを index に残す
+    fileExists = True
+
+    def saveColumns(self, dirName):
+        scalars = {}
+        columns = {}
+        for key, value in vars(self).items():
+            if isColumnValue(value):
+                columns[key] = saveColumn(dirName, "{}.{}".format(type(self).__name__, key), value)
+            else:
+                scalars[key] = value
+        return {"scalars": scalars, "columns": columns}
+
+    def loadColumns(self, dirName, meta):
+        self.__dict__.update(meta["scalars"])
+        self.storeDir = dirName
+        self.storeColumns = meta["columns"]
+
+    def detachStore(self):
+        # store の列を全て読み, 元の store と切り離す. 別の場所に保存し直す前に呼ぶ
+        for name in list(self.__dict__.get("storeColumns", {})):
+            getattr(self, name)
+        self.__dict__.pop("storeDir", None)
+        self.__dict__.pop("storeColumns", None)
+
+    def dropColumn(self, name):
+        self.__dict__.pop(name, None)
+        if "storeColumns" in self.__dict__:
+            self.storeColumns = {key: column for key, column in self.storeColumns.items() if key != name}
+
+    def checkMerge(self, other, nameList):
+        for name in nameList:
+            if getattr(self, name) != getattr(other, name):
+                print("Cannot merge {} with different {}".format(type(self).__name__, name))
+                sys.exit(1)
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("storeColumns")
+        if columns is None or name not in columns:
+            raise AttributeError(name)
+        with stage("store.loadColumn"):
+            value = loadColumn(self.storeDir, columns[name])
+        setattr(self, name, value)
+        return value
+
+
+class AdjustData(ColumnData):
+    # 1 行が 1 run で "step/tx/rx" を ',' で並べている. 3 つの RaggedArray は同じ offsets を持つ
+    @timed("parse.AdjustData")
     def __init__(self, fileName):
-        self.fileName = "../result/adjust_batch_" + fileName
-        if not os.path.isfile(self.fileName):
+        self.fileName = RESULT_DIR + "adjust_batch_" + fileName
+        self.sourceStamp = FileStamp(self.fileName)
+        self.fileExists = os.path.isfile(self.fileName)
+        if not self.fileExists:
+            # adjust_batch_ が無い時は 0 run として扱い, 指標は nan になる
+            for name in ["adjustStep", "adjustNumTx", "adjustNumRx"]:
+                setattr(self, name, RaggedArray(np.zeros(0, dtype=VALUE_DTYPE), np.zeros(1, dtype=VALUE_DTYPE)))
             return
         self.parseFile()
-        # self.createGraphData()
 
     def parseFile(self):
-        self.adjustStep = []
-        self.adjustNumTx = []
-        self.adjustNumRx = []
-
         with open(self.fileName, 'r') as f:
-            for line in f:
-                steps = []
-                adjustTx = []
-                adjustRx = []
-
-                datas = line.split(',')
-                for data in datas:
-                    step, tx, rx = data.split('/')
-                    steps.append(int(step))
-                    adjustTx.append(int(tx))
-                    adjustRx.append(int(rx))
-
-                self.adjustStep.append(steps)
-                self.adjustNumTx.append(adjustTx)
-                self.adjustNumRx.append(adjustRx)
-
-class ResultData:
-    def __init__(self, fileName):
-        self.fileName = "../result/batch_" + fileName
-        self.parseFile()
+            fieldList = [line.strip().replace(',', '/') for line in f]
+        triples = parseRaggedField(fieldList)
+        values = triples.values.reshape(-1, 3)
+        offsets = triples.offsets // 3
+
+        self.adjustStep = RaggedArray(np.ascontiguousarray(values[:, 0]), offsets)
+        self.adjustNumTx = RaggedArray(np.ascontiguousarray(values[:, 1]), offsets)
+        self.adjustNumRx = RaggedArray(np.ascontiguousarray(values[:, 2]), offsets)
+        addFileRead("parse.AdjustData", self.fileName, len(self.adjustStep))
+
+    def merge(self, other):
+        # other の run を後ろに足す
+        for name in ["adjustStep", "adjustNumTx", "adjustNumRx"]:
+            setattr(self, name, concatRagged([getattr(self, name), getattr(other, name)]))
+        return self
+
+class ResultData(ColumnData):
+    # streaming=True では chunk ごとに読んで統計量だけを持つ.
+    # med_ は keepSteps で steps を残した時だけ正確な値, それ以外は QuantileSketch の近似値で相対誤差は stats.SKETCH_ALPHA 以下
+    @timed("parse.ResultData")
+    def __init__(self, fileName, streaming=False, keepSteps=False):
+        self.fileName = RESULT_DIR + "batch_" + fileName
+        self.sourceStamp = FileStamp(self.fileName)
+        self.streaming = streaming
+        if streaming:
+            self.parseFileStreaming(keepSteps)
+        else:
+            self.parseFile()
+        self.setSummary()
+
+    def setSummary(self):
+        if self.streaming:
+            self.min_ = self.stats.min
+            self.max_ = self.stats.max
+            self.mean_ = self.stats.mean
+            self.std_ = self.stats.getStd()
+            # steps を残していれば median は正確な値にする
+            self.med_ = np.median(self.steps) if hasattr(self, "steps") else self.sketch.getMedian()
+            return
 
         self.min_ = np.min(self.steps)
         self.max_ = np.max(self.steps)
@@ -136,43 +425,155 @@ class ResultData:
         self.med_ = np.median(self.steps)
 
     def parseFile(self):
-        stepArray = []
-        with open(self.fileName, 'r') as f:
-            for line in f:
-                stepArray.append(line.strip())
+        self.steps = parseIntFile(self.fileName)
+        addFileRead("parse.ResultData", self.fileName, len(self.steps))
 
-        self.steps = np.array(stepArray, dtype=int)
-        # print(self.steps)
-
-class CollisionData:
-    def __init__(self, fileName):
-        self.fileName = "../result/collision_batch_" + fileName
-        if not os.path.isfile(self.fileName):
+    def parseFileStreaming(self, keepSteps):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch()
+        stepsList = []
+        with open(self.fileName, 'r') as f:
+            while True:
+                lines = f.readlines(STREAMING_CHUNK_SIZE)
+                if not lines:
+                    break
+                steps = parseIntText("".join(lines), ' ')
+                self.stats.update(steps)
+                self.sketch.update(steps)
+                if keepSteps:
+                    stepsList.append(steps)
+
+        if keepSteps:
+            self.steps = np.concatenate(stepsList) if stepsList else np.zeros(0, dtype=int)
+        addFileRead("parse.ResultData", self.fileName, self.stats.count)
+
+    def merge(self, other):
+        # other の run を後ろに足す. streaming では統計量と sketch を合成し, steps は両方にある時だけ残す
+        self.checkMerge(other, ["streaming"])
+        if self.streaming:
+            self.stats.merge(other.stats)
+            self.sketch.merge(other.sketch)
+            if hasattr(self, "steps") and hasattr(other, "steps"):
+                self.steps = np.concatenate([self.steps, other.steps])
+            else:
+                self.dropColumn("steps")
+        else:
+            self.steps = np.concatenate([self.steps, other.steps])
+        self.setSummary()
+        return self
+
+    def getRunNum(self):
+        return self.stats.count if self.streaming else len(self.steps)
+
+    def getPercentile(self, q):
+        if not self.streaming or hasattr(self, "steps"):
+            return np.percentile(self.steps, q)
+        return self.sketch.getQuantile(q / 100)
+
+class CollisionData(ColumnData):
+    # run ごとの衝突数, 種類ごと (AA, AI, AN, II, IN) の全 run の合計, collisionBinStep 幅の全 run の histogram を持つ
+    # streaming=True では chunk ごとに読んでこれらだけを持ち, 全ての step (collisionStep など) は残さない
+    @timed("parse.CollisionData")
+    def __init__(self, fileName, streaming=False, binStep=COLLISION_BIN_STEP):
+        self.fileName = RESULT_DIR + "collision_batch_" + fileName
+        self.sourceStamp = FileStamp(self.fileName)
+        self.streaming = streaming
+        self.collisionBinStep = binStep
+        self.fileExists = os.path.isfile(self.fileName)
+        if not self.fileExists:
             return
-        self.parseFile()
+        self.collisionRunNum = 0
+        self.collisionSum = 0
+        self.collisionMaxStep = 0
+        self.collisionTotalTypeNum = np.zeros(5, dtype=np.int64)
+        self.collisionHistogram = np.zeros(0, dtype=np.int64)
+        perRunList = []
+
+        if streaming:
+            self.parseFileStreaming(perRunList)
+        else:
+            self.parseFile(perRunList)
 
-        self.collisionAllStep = []
-        for i in range(len(self.collisionStep)):
-            self.collisionAllStep.extend([int(j) for j in self.collisionStep[i] if int(j) != 0])
+            # 衝突が無い run は 0 が書かれている
+            steps = self.collisionStep.values
+            self.collisionAllStep = steps[steps != 0]
 
-        step = sorted(self.collisionAllStep)
-        self.collisionNumData = step
+            self.collisionNumData = np.sort(self.collisionAllStep)
 
-        self.collisionSum = len(self.collisionAllStep)
+        self.collisionPerRun = np.concatenate(perRunList) if perRunList else np.zeros(0, dtype=np.int64)
+        self.appendCollision(self.collisionTotalTypeNum)
 
-    def parseFile(self):
-        self.collisionStep = []
-        self.collisionAA = []
-        self.collisionAI = []
-        self.collisionAN = []
-        self.collisionII = []
-        self.collisionIN = []
+    def parseFile(self, perRunList):
+        lineFields = readLineFields(self.fileName)
+        self.collisionStep = parseRaggedField([datas[0] for datas in lineFields])
+        self.collisionTypeNum = parseTable([datas[1] for datas in lineFields], width=5)
+        self.accumulate(self.collisionStep, self.collisionTypeNum, perRunList)
+        addFileRead("parse.CollisionData", self.fileName, len(lineFields))
 
+    def parseFileStreaming(self, perRunList):
+        for collisionStep, collisionTypeNum in self.iterChunks():
+            self.accumulate(collisionStep, collisionTypeNum, perRunList)
+        addFileRead("parse.CollisionData", self.fileName, self.collisionRunNum)
+
+    def iterChunks(self):
+        # STREAMING_CHUNK_SIZE ごとに (collisionStep, collisionTypeNum) を返す
         with open(self.fileName, 'r') as f:
-            for line in f:
-                datas = line.split(',')
-                self.collisionStep.append(datas[0].split('/'))
-                self.appendCollision(datas[1].split('/'))
+            while True:
+                lines = f.readlines(STREAMING_CHUNK_SIZE)
+                if not lines:
+                    break
+                lineFields = [line.split(',') for line in lines]
+                yield parseRaggedField([datas[0] for datas in lineFields]), parseTable([datas[1] for datas in lineFields], width=5)
+
+    def accumulate(self, collisionStep, collisionTypeNum, perRunList):
+        # chunk の分を合計と histogram に足し, run ごとの衝突数を追加する
+        steps = collisionStep.values[collisionStep.values != 0]
+        self.collisionRunNum += len(collisionStep)
+        self.collisionSum += len(steps)
+        self.collisionTotalTypeNum += collisionTypeNum.sum(axis=0)
+        if len(steps) > 0:
+            self.collisionMaxStep = max(self.collisionMaxStep, int(steps.max()))
+        perRunList.append(countCollisionPerRun(collisionStep))
+        self.collisionHistogram = addHistogram(self.collisionHistogram, np.bincount((steps - 1) // self.collisionBinStep))
+
+    def getRunHistogram(self, binStep):
+        # run ごとの binStep 幅の histogram は transition を求める時だけ作る. streaming では結果ファイルを chunk ごとに読み直す
+        if not self.streaming:
+            return calcRunHistogram(self.collisionStep, binStep)
+        if self.fileName is None or not os.path.isfile(self.fileName):
+            print("Not Define run histogram of {} with streaming (result file is not available)".format(self.fileName))
+            sys.exit(1)
+        runHistogramList = [calcRunHistogram(collisionStep, binStep) for collisionStep, _ in self.iterChunks()]
+        binNum = max([runHistogram.shape[1] for runHistogram in runHistogramList], default=0)
+        return np.concatenate([resizeColumns(runHistogram, binNum) for runHistogram in runHistogramList]
+                              + [np.zeros((0, binNum), dtype=np.int32)])
+
+    def merge(self, other):
+        # other の run を後ろに足す. 全ての step は両方が streaming でない時だけ残す
+        # streaming では結果ファイルが一部の run しか持たないので, 読み直せないようにする
+        self.checkMerge(other, ["streaming", "collisionBinStep"])
+        self.collisionRunNum += other.collisionRunNum
+        self.collisionSum += other.collisionSum
+        self.collisionMaxStep = max(self.collisionMaxStep, other.collisionMaxStep)
+        self.collisionTotalTypeNum = self.collisionTotalTypeNum + other.collisionTotalTypeNum
+        self.collisionPerRun = np.concatenate([self.collisionPerRun, other.collisionPerRun])
+        self.collisionHistogram = addHistogram(self.collisionHistogram, other.collisionHistogram)
+        self.appendCollision(self.collisionTotalTypeNum)
+
+        if self.streaming:
+            self.fileName = None
+        else:
+            self.collisionStep = concatRagged([self.collisionStep, other.collisionStep])
+            self.collisionTypeNum = np.concatenate([self.collisionTypeNum, other.collisionTypeNum])
+            self.collisionAllStep = np.concatenate([self.collisionAllStep, other.collisionAllStep])
+            self.collisionNumData = np.sort(self.collisionAllStep)
+        return self
+
+    def checkStepData(self, step, name):
+        # streaming では全ての step を持たないので, histogram の bin 幅の倍数しか数えられない
+        if self.streaming:
+            print("Not Define step {} in {} with streaming (must be a multiple of {})".format(step, name, self.collisionBinStep))
+            sys.exit(1)
 
     def appendCollision(self, datas):
         self.collisionAA = datas[0]
@@ -182,48 +583,82 @@ class CollisionData:
         self.collisionIN = datas[4]
 
 
-class RetransmitData:
+class RetransmitData(ColumnData):
+    @timed("parse.RetransmitData")
     def __init__(self, fileName):
-        self.fileName = "../result/retransmission_batch_" + fileName
-        if not os.path.isfile(self.fileName):
+        self.fileName = RESULT_DIR + "retransmission_batch_" + fileName
+        self.sourceStamp = FileStamp(self.fileName)
+        self.fileExists = os.path.isfile(self.fileName)
+        if not self.fileExists:
             return
         self.parseFile()
 
-        self.maxRetransmitNum = np.max(self.retransmitNum)
-        self.minRetransmitNum = np.min(self.retransmitNum)
+        self.maxRetransmitNum = np.max(self.retransmitNum) if len(self.retransmitNum) > 0 else 0
+        self.minRetransmitNum = np.min(self.retransmitNum) if len(self.retransmitNum) > 0 else 0
 
-        self.retransmitNum = sorted(self.retransmitNum)
-        self.retransmitNumData = []
-
-        for i in range(self.maxRetransmitNum + 1):
-            num = len([j for j in self.retransmitNum if i == j])
-            self.retransmitNumData.append(num)
+        self.retransmitNum = np.sort(self.retransmitNum)
+        self.retransmitNumData = np.bincount(self.retransmitNum, minlength=self.maxRetransmitNum + 1)
 
     def parseFile(self):
-        self.retransmitFailureCount = 0
-        self.retransmitStep = []
-        self.retransmitTxStep = []
-        self.retransmitRxStep = []
-        self.retransmitNum = []
+        lineFields = readLineFields(self.fileName)
 
-        with open(self.fileName, 'r') as f:
-            for line in f:
-                datas = line.split(',')
+        self.retransmitFailureCount = sum(1 for datas in lineFields if datas[0] == "F")
+        self.retransmitStep = parseRaggedField([datas[1] for datas in lineFields], skipFirst=True)
+        self.retransmitNum = countRetransmissionPerRun(lineFields)
+        self.retransmitTxStep = parseRaggedField([datas[2] if len(datas) == 4 else "" for datas in lineFields], skipFirst=True)
+        self.retransmitRxStep = parseRaggedField([datas[3] if len(datas) == 4 else "" for datas in lineFields], skipFirst=True)
+        addFileRead("parse.RetransmitData", self.fileName, len(lineFields))
 
-                if datas[0] == "F":
-                    self.retransmitFailureCount += 1
+    def merge(self, other):
+        # other の run を後ろに足す. retransmitNum は並べ替えてあるので run の順は持たない
+        self.retransmitFailureCount += other.retransmitFailureCount
+        for name in ["retransmitStep", "retransmitTxStep", "retransmitRxStep"]:
+            setattr(self, name, concatRagged([getattr(self, name), getattr(other, name)]))
+        self.retransmitNum = np.sort(np.concatenate([self.retransmitNum, other.retransmitNum]))
+        self.maxRetransmitNum = np.max(self.retransmitNum) if len(self.retransmitNum) > 0 else 0
+        self.minRetransmitNum = np.min(self.retransmitNum) if len(self.retransmitNum) > 0 else 0
+        self.retransmitNumData = np.bincount(self.retransmitNum, minlength=self.maxRetransmitNum + 1)
+        return self
 
-                self.retransmitStep.append(datas[1].split('/')[1:])
-                self.retransmitNum.append(len(datas[1]) - 1)
 
-                if len(datas) == 4:
-                    self.retransmitTxStep.append(datas[2].split('/')[1:])
-                    self.retransmitRxStep.append(datas[3].split('/')[1:])
-                else:
-                    self.retransmitTxStep.append([])
-                    self.retransmitRxStep.append([])
+def splitArgs(val, pattern=r"[,( )]"):
+    return [i for i in re.split(pattern, val) if i != '']
+
+
+def calcDistances(fromPositions, toPositions):
+    # (n, 3) の座標の組ごとの距離をまとめて求める
+    delta = np.asarray(fromPositions, dtype=float) - np.asarray(toPositions, dtype=float)
+    return np.sqrt(np.sum(delta ** 2, axis=-1))
+
+
+class ConfigValue:
+    # dat の設定値. __slots__ の値の組が同じなら等しいとみなし, dict のキーにも使える
+    # 持たない属性 (NOISE の typeOfMovement など) は None として扱う
+    __slots__ = ()
+
+    def getSlotValues(self):
+        return tuple(getattr(self, name, None) for name in self.__slots__)
+
+    def getKey(self):
+        return self.getSlotValues()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.getKey() == other.getKey()
+
+    def __hash__(self):
+        return hash((type(self).__name__, self.getKey()))
+
+    def __getstate__(self):
+        return self.getSlotValues()
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            if value is not None:
+                setattr(self, name, value)
+
+class Position(ConfigValue):
+    __slots__ = ("x", "y", "z")
 
-class Position:
     def __init__(self, args):
         self.x = int(args[0])
         self.y = int(args[1])
@@ -238,18 +673,56 @@ class Position:
         delZ = self.z - toPos.z
         return math.sqrt(delX ** 2 + delY ** 2 + delZ ** 2)
 
-class MicrotubuleParams:
+class MicrotubuleParams(ConfigValue):
+    __slots__ = ("startPosition", "endPosition")
+
     def __init__(self, val):
-        args = [i for i in re.split(r"[,( )]", val) if i != '']
+        self.setPositions(splitArgs(val))
+
+    def setPositions(self, args):
         self.startPosition = Position(args[0:3])
         self.endPosition = Position(args[3:6])
 
+    @classmethod
+    def fromArray(cls, row):
+        microtubule = cls.__new__(cls)
+        microtubule.setPositions(row)
+        return microtubule
+
     def toString(self):
         return "{} {}".format(self.startPosition.toString(), self.endPosition.toString())
 
-class MoleculeParams:
+class MicrotubuleArray(ConfigValue):
+    # 全ての microtubule の始点と終点を (n, 6) の int 配列で持つ. 要素は参照した時に MicrotubuleParams にする
+    __slots__ = ("positions",)
+
+    def __init__(self, rowList):
+        self.positions = np.array(rowList, dtype=np.int64).reshape(len(rowList), 6)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        return MicrotubuleParams.fromArray(self.positions[i])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def getKey(self):
+        return tuple(self.positions.ravel().tolist())
+
+    def getLengths(self):
+        return calcDistances(self.positions[:, 0:3], self.positions[:, 3:6])
+
+    def toString(self):
+        return " ".join(microtubule.toString() for microtubule in self)
+
+class MoleculeParams(ConfigValue):
+    __slots__ = ("duplication", "typeOfMolecule", "size", "typeOfMovement", "adaptiveChangeNumber")
+
     def __init__(self, val):
-        args = [i for i in re.split(r"[ ]", val) if i != '']
+        args = splitArgs(val, r"[ ]")
         self.duplication = int(args[0])
         self.typeOfMolecule = MoleculeType[args[1]]
         self.size = 1
@@ -272,9 +745,13 @@ class MoleculeParams:
         else:
             return "{} {} {}".format(self.duplication, self.typeOfMolecule.name, self.size)
 
-class IntermediateNode:
+class IntermediateNode(ConfigValue):
+    __slots__ = ("centerPosition", "size", "infoReleasePosition", "ackReleasePosition")
+
     def __init__(self, val):
-        args = [i for i in re.split(r"[,( )]", val) if i != '']
+        self.setArgs(splitArgs(val))
+
+    def setArgs(self, args):
         self.centerPosition = Position(args[0:3])
         self.size = int(args[3])
         self.infoReleasePosition = Position(args[4:7])
@@ -283,9 +760,13 @@ class IntermediateNode:
     def toString(self):
         return "{} {} {} {}".format(self.centerPosition.toString(), self.size, self.infoReleasePosition.toString(), self.ackReleasePosition.toString())
 
-class NanoMachine:
+class NanoMachine(ConfigValue):
+    __slots__ = ("centerPosition", "size", "releasePosition")
+
     def __init__(self, val):
-        args = [i for i in re.split(r"[,( )]", val) if i != '']
+        self.setArgs(splitArgs(val))
+
+    def setArgs(self, args):
         self.centerPosition = Position(args[0:3])
         self.size = int(args[3])
         self.releasePosition = Position(args[4:7])
@@ -293,13 +774,18 @@ class NanoMachine:
     def toString(self):
         return "{} {} {}".format(self.centerPosition.toString(), self.size, self.releasePosition.toString())
 
-class FEC:
+class FEC(ConfigValue):
+    __slots__ = ("type", "requirePacket", "rate")
+
     def __init__(self, val):
-        args = [i for i in re.split(r"[,( )]", val) if i != '']
+        args = splitArgs(val)
         self.type = args[0]
         self.requirePacket = int(args[1])
         self.rate = float(args[2])
 
+    def toString(self):
+        return "{} {} {}".format(self.type, self.requirePacket, self.rate)
+
 class MoleculeType(Enum):
     INFO = 0
     ACK = 1
@@ -0,0 +1,142 @@
+import os
+import csv
+import json
+import time
+import functools
+import contextlib
+
+SUMMARY_FIELD_LIST = ["stage", "calls", "seconds", "bytesRead", "rows", "figures"]
+
+
+class StageRecord:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytesRead = 0
+        self.rows = 0
+        self.figures = 0
+
+    def merge(self, other):
+        self.calls += other.calls
+        self.seconds += other.seconds
+        self.bytesRead += other.bytesRead
+        self.rows += other.rows
+        self.figures += other.figures
+
+
+class Recorder:
+    # stage ごとの時間と読んだ量を集計する. 入れ子の stage の時間は親にも含まれる
+    def __init__(self):
+        self.recordDict = {}
+
+    def getRecord(self, name):
+        if name not in self.recordDict:
+            self.recordDict[name] = StageRecord()
+        return self.recordDict[name]
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.getRecord(name)
+            record.calls += 1
+            record.seconds += time.perf_counter() - start
+
+    def addCount(self, name, bytesRead=0, rows=0, figures=0):
+        record = self.getRecord(name)
+        record.bytesRead += bytesRead
+        record.rows += rows
+        record.figures += figures
+
+    def snapshot(self):
+        # worker process の集計を親に返すために取り出して空にする
+        recordDict = self.recordDict
+        self.recordDict = {}
+        return recordDict
+
+    def merge(self, recordDict):
+        for name, record in recordDict.items():
+            self.getRecord(name).merge(record)
+
+    def getRows(self):
+        rows = []
+        for name, record in sorted(self.recordDict.items(), key=lambda item: -item[1].seconds):
+            rows.append({"stage": name, "calls": record.calls, "seconds": round(record.seconds, 6),
+                         "bytesRead": record.bytesRead, "rows": record.rows, "figures": record.figures})
+        return rows
+
+    def writeSummary(self, fileName):
+        # 拡張子が .csv なら CSV, それ以外は JSON
+        rows = self.getRows()
+        with open(fileName, 'w', newline='') as f:
+            if fileName.endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELD_LIST)
+                writer.writeheader()
+                writer.writerows(rows)
+            else:
+                json.dump(rows, f, indent=1)
+
+    def printSummary(self):
+        print("{:<40} {:>6} {:>10} {:>12} {:>10} {:>8}".format(*SUMMARY_FIELD_LIST))
+        for row in self.getRows():
+            print("{stage:<40} {calls:>6} {seconds:>10.3f} {bytesRead:>12} {rows:>10} {figures:>8}".format(**row))
+
+
+RECORDER = Recorder()
+
+
+def stage(name):
+    return RECORDER.stage(name)
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with RECORDER.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def addCount(name, bytesRead=0, rows=0, figures=0):
+    RECORDER.addCount(name, bytesRead, rows, figures)
+
+
+def addFileRead(name, fileName, rows):
+    addCount(name, os.path.getsize(fileName), rows)
+
+
+class DeepProfiler:
+    # cProfile と tracemalloc は重いので明示的に有効にした時だけ使う
+    def __init__(self, isProfile=False, isTraceMemory=False):
+        self.isProfile = isProfile
+        self.isTraceMemory = isTraceMemory
+        self.profile = None
+
+    def start(self):
+        if self.isTraceMemory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.isProfile:
+            import cProfile
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self, outputPrefix):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(outputPrefix + ".prof")
+            print("Write cProfile stats to {}.prof".format(outputPrefix))
+        if self.isTraceMemory:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            with open(outputPrefix + "_memory.txt", 'w') as f:
+                f.write("current {} bytes, peak {} bytes\n".format(current, peak))
+                for stat in snapshot.statistics("lineno")[:30]:
+                    f.write("{}\n".format(stat))
+            print("Write tracemalloc stats to {}_memory.txt".format(outputPrefix))
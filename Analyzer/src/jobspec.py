@@ -0,0 +1,66 @@
+import os
+import sys
+import json
+from analyzer import GraphJob, XValue, YValue
+
+# job の書き方 (JSON / YAML の "jobs" の要素)
+#   {"x": "DISTANCE", "y": "MEAN", "label": "DUPLICATION", "classify": "ALL", "interval": true}
+#   {"type": "collision"} / {"type": "retransmission"}
+# コマンドラインでは "DISTANCE:MEAN:DUPLICATION[:ALL][:interval]" か "collision" / "retransmission"
+PER_SIMULATION_KIND_LIST = ["retransmission", "collision"]
+
+
+def parseEnum(enumClass, name):
+    try:
+        return enumClass[str(name).strip().upper()]
+    except KeyError:
+        print("Not Define {} in {}".format(name, enumClass.__name__))
+        sys.exit(1)
+
+
+def parseJob(entry):
+    kind = entry.get("type", "specific")
+    if kind in PER_SIMULATION_KIND_LIST:
+        return GraphJob(kind)
+    if kind != "specific":
+        print("Not Define {} in parseJob".format(kind))
+        sys.exit(1)
+    for key in ["x", "y", "label"]:
+        if key not in entry:
+            print("Job {} has no {}".format(entry, key))
+            sys.exit(1)
+    return GraphJob(kind, parseEnum(XValue, entry["x"]), parseEnum(YValue, entry["y"]), parseEnum(XValue, entry["label"]),
+                    parseEnum(XValue, entry.get("classify", "ALL")), bool(entry.get("interval", False)))
+
+
+def parseJobText(text):
+    if text.strip().lower() in PER_SIMULATION_KIND_LIST:
+        return GraphJob(text.strip().lower())
+    args = text.split(":")
+    isInterval = args[-1].strip().lower() == "interval"
+    if isInterval:
+        args = args[:-1]
+    if len(args) not in [3, 4]:
+        print("Cannot parse job {} (x:y:label[:classify][:interval])".format(text))
+        sys.exit(1)
+    entry = {"x": args[0], "y": args[1], "label": args[2], "interval": isInterval}
+    if len(args) == 4:
+        entry["classify"] = args[3]
+    return parseJob(entry)
+
+
+def loadJobSpec(fileName):
+    # .json か .yaml / .yml. 中身は job のリストか {"jobs": [...]}
+    with open(fileName, 'r') as f:
+        if os.path.splitext(fileName)[1] in [".yaml", ".yml"]:
+            try:
+                import yaml
+            except ImportError:
+                print("PyYAML is required for {}".format(fileName))
+                sys.exit(1)
+            spec = yaml.safe_load(f)
+        else:
+            spec = json.load(f)
+    if isinstance(spec, dict):
+        spec = spec.get("jobs", [])
+    return [parseJob(entry) for entry in spec]
@@ -0,0 +1,56 @@
+import os
+from functools import partial
+from multiprocessing import Pool
+from data import AllData, createSubData
+from instrument import RECORDER
+
+
+def defineWorkerNum(workerNum, fileNum):
+    if workerNum is None or workerNum <= 0:
+        workerNum = os.cpu_count() or 1
+    return max(1, min(workerNum, fileNum))
+
+
+def readAllData(fileName, streaming=False, keepSteps=False):
+    # 計測結果も一緒に返して親 process で集計する. fork 時に親から引き継いだ分は捨てる
+    RECORDER.snapshot()
+    data = AllData(fileName, streaming, keepSteps)
+    return fileName, data, RECORDER.snapshot()
+
+
+def iterAllData(fileList, workerNum=None, streaming=False, keepSteps=False):
+    # 読み終わった順に (fileName, AllData) を返す
+    workerNum = defineWorkerNum(workerNum, len(fileList))
+    read = partial(readAllData, streaming=streaming, keepSteps=keepSteps)
+    if workerNum == 1:
+        for fileName in fileList:
+            yield fileName, AllData(fileName, streaming, keepSteps)
+        return
+
+    with Pool(workerNum) as pool:
+        for fileName, data, recordDict in pool.imap_unordered(read, fileList):
+            RECORDER.merge(recordDict)
+            yield fileName, data
+
+
+def readSubData(args):
+    fileName, key, outputFileName, streaming, keepSteps = args
+    RECORDER.snapshot()
+    data = createSubData(key, outputFileName, streaming, keepSteps)
+    return fileName, data, RECORDER.snapshot()
+
+
+def iterSubData(dataDict, fileList, key, workerNum=None):
+    # fileList の結果ファイルのうち key のものだけを読んで (fileName, data) を返す
+    argsList = [(fileName, key, dataDict[fileName].outputFileName, dataDict[fileName].streaming, dataDict[fileName].keepSteps)
+                for fileName in fileList]
+    workerNum = defineWorkerNum(workerNum, len(argsList))
+    if workerNum == 1:
+        for fileName, key, outputFileName, streaming, keepSteps in argsList:
+            yield fileName, createSubData(key, outputFileName, streaming, keepSteps)
+        return
+
+    with Pool(workerNum) as pool:
+        for fileName, data, recordDict in pool.imap_unordered(readSubData, argsList):
+            RECORDER.merge(recordDict)
+            yield fileName, data
@@ -1,38 +1,92 @@
 import os
-import pickle
 from natsort import natsorted
 import glob
-from data import AllData
+import argparse
 from analyzer import Analyzer
+from cache import DataCache
+from loader import iterAllData
+from instrument import RECORDER, DeepProfiler, timed
+from table import buildSweepTable
+from jobspec import loadJobSpec, parseJobText
 
-PICKLE_FILE = '../pickle.txt'
 DAT_PATH = '../dat/*.dat'
+# 0 なら CPU 数だけプロセスを使う
+WORKER_NUM = 0
+# True なら batch_ を chunk で読み, median は近似値になる
+STREAMING = False
+# streaming でも RTT を全て残す. MEDIAN, JITTER の信頼区間に使う
+KEEP_STEPS = False
+# 各 stage の時間と読んだ量の集計を書き出す (.json と .csv)
+SUMMARY_FILE = '../analysis_summary'
+# 詳しく調べる時だけ True にする. ../analysis.prof, ../analysis_memory.txt に書き出す
+PROFILE = False
+TRACE_MEMORY = False
+PROFILE_PREFIX = '../analysis'
+# 1 行 1 設定の表の書き出し先 (.csv, .npz, .parquet, .feather). None なら書き出さない
+TABLE_FILE = None
 
 
-def createDataDict(allFileList):
+@timed("main.createDataDict")
+def createDataDict(allFileList, cache, workerNum=WORKER_NUM, streaming=STREAMING, keepSteps=KEEP_STEPS):
+    # 結果ファイルは Analyzer が必要になった時に読む
     dataDict = {}
-    if os.path.isfile(PICKLE_FILE):
-        with open(PICKLE_FILE, 'rb') as f:
-            dataDict = pickle.load(f)
-    else:
-        print("Start to Read Dat File...")
-        count = 1
-        for fileName in allFileList:
-            print("{} / {} - {} file reading...".format(count, len(allFileList), fileName.split("/")[2]))
-            dataDict[fileName] = AllData(fileName)
-            count += 1
-        with open(PICKLE_FILE, 'wb') as f:
-            pickle.dump(dataDict, f)
+    cache.evict(allFileList)
 
+    readFileList = []
+    for fileName in allFileList:
+        data = cache.load(fileName)
+        if data is None:
+            readFileList.append(fileName)
+        else:
+            dataDict[fileName] = data
 
-    return dataDict
+    print("Start to Read Dat File...")
+    count = 1
+    for fileName, data in iterAllData(readFileList, workerNum, streaming, keepSteps):
+        print("{} / {} - {} file read".format(count, len(readFileList), os.path.basename(fileName)))
+        dataDict[fileName] = data
+        cache.store(fileName, data)
+        count += 1
+    cache.saveIndex()
+
+    return {fileName: dataDict[fileName] for fileName in allFileList}
+
+
+def createJobList(args):
+    # 指定が無ければ analyzer.DEFAULT_JOB_LIST を描く
+    if args.jobs is None and not args.job:
+        return None
+    jobList = [] if args.jobs is None else loadJobSpec(args.jobs)
+    return jobList + [parseJobText(text) for text in args.job]
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze MolComSim results and draw graphs")
+    parser.add_argument("--jobs", default=None, help="JSON or YAML file listing the graphs to draw")
+    parser.add_argument("--job", action="append", default=[], help="graph to draw as x:y:label[:classify][:interval] (repeatable)")
+    args = parser.parse_args()
+    jobList = createJobList(args)
+
+    profiler = DeepProfiler(PROFILE, TRACE_MEMORY)
+    profiler.start()
+
     allFileList = natsorted(glob.glob(DAT_PATH))
-    dataDict = createDataDict(allFileList)
-    analyzer = Analyzer(dataDict, allFileList)
-    analyzer.drawGraph()
+    cache = DataCache(options={"streaming": STREAMING, "keepSteps": KEEP_STEPS})
+    dataDict = createDataDict(allFileList, cache)
+    analyzer = Analyzer(dataDict, allFileList, WORKER_NUM)
+    try:
+        analyzer.drawGraph(jobList)
+        if TABLE_FILE is not None:
+            buildSweepTable(analyzer).save(TABLE_FILE)
+            print("Write sweep table to {}".format(TABLE_FILE))
+    finally:
+        # 描画中に読んだ結果も cache に残す
+        cache.saveIndex()
+
+    profiler.stop(PROFILE_PREFIX)
+    RECORDER.printSummary()
+    RECORDER.writeSummary(SUMMARY_FILE + ".json")
+    RECORDER.writeSummary(SUMMARY_FILE + ".csv")
 
 
 if __name__ == "__main__":
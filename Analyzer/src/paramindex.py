@@ -0,0 +1,86 @@
+def makeHashable(value):
+    if isinstance(value, list):
+        return tuple(makeHashable(v) for v in value)
+    if hasattr(value, "toString"):
+        return value.toString()
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class ParameterIndex:
+    # key は XValue, YValue か DatData.config のキー (str)
+    # 値は key ごとに一度だけ計算し, 値 -> ファイルの対応と一緒に持っておく
+    # batchValueFunc(dataList, key) が None 以外を返せば全ファイルの値をまとめて求める
+    def __init__(self, dataDict, allFileList, valueFunc, batchValueFunc=None):
+        self.dataDict = dataDict
+        self.allFileList = allFileList
+        self.valueFunc = valueFunc
+        self.batchValueFunc = batchValueFunc
+        self.valueDict = {}
+        self.fileDict = {}
+        self.groupDict = {}
+
+    def buildKey(self, key):
+        values = {}
+        files = {}
+        batchValues = None
+        if not isinstance(key, str) and self.batchValueFunc is not None:
+            batchValues = self.batchValueFunc([self.dataDict[fileName] for fileName in self.allFileList], key)
+        for i, fileName in enumerate(self.allFileList):
+            data = self.dataDict[fileName]
+            if isinstance(key, str):
+                value = makeHashable(data.datData.config.get(key))
+            elif batchValues is not None:
+                value = batchValues[i]
+            else:
+                value = self.valueFunc(data, key)
+            values[fileName] = value
+            files.setdefault(value, []).append(fileName)
+        self.valueDict[key] = values
+        self.fileDict[key] = files
+
+    def getValueDict(self, key):
+        if key not in self.valueDict:
+            self.buildKey(key)
+        return self.valueDict[key]
+
+    def getValue(self, fileName, key):
+        return self.getValueDict(key)[fileName]
+
+    def getValues(self, key, fileList=None):
+        # fileList に出てくる順で重複なし
+        if fileList is None or fileList is self.allFileList:
+            self.getValueDict(key)
+            return list(self.fileDict[key].keys())
+        values = self.getValueDict(key)
+        return list(dict.fromkeys(values[fileName] for fileName in fileList))
+
+    def getFiles(self, key, value):
+        self.getValueDict(key)
+        return self.fileDict[key].get(value, [])
+
+    def groupBy(self, keys, fileList=None):
+        # {(key1 の値, key2 の値, ...): [fileName, ...]}
+        keys = tuple(keys)
+        if fileList is self.allFileList:
+            fileList = None
+        if fileList is None and keys in self.groupDict:
+            return self.groupDict[keys]
+        valueDicts = [self.getValueDict(key) for key in keys]
+        groups = {}
+        for fileName in (self.allFileList if fileList is None else fileList):
+            groups.setdefault(tuple(values[fileName] for values in valueDicts), []).append(fileName)
+        if fileList is None:
+            self.groupDict[keys] = groups
+        return groups
+
+    def filter(self, conditions, fileList=None):
+        # conditions は {key: 値}, すべてに一致するファイルを返す
+        matchSet = None
+        for key, value in conditions.items():
+            files = set(self.getFiles(key, makeHashable(value)))
+            matchSet = files if matchSet is None else matchSet & files
+        if matchSet is None:
+            return list(self.allFileList if fileList is None else fileList)
+        return [fileName for fileName in (self.allFileList if fileList is None else fileList) if fileName in matchSet]
@@ -0,0 +1,141 @@
+import os
+import sys
+import glob
+import time
+import queue
+import argparse
+import threading
+from natsort import natsorted
+from analyzer import Analyzer
+from cache import DataCache
+from data import AllData, DatData, RESULT_DIR, RESULT_PREFIX_LIST
+from runner import createRunner, addAdaptiveArguments
+import main as analyzeMain
+
+POLL_INTERVAL = 10
+
+
+class ResultWatcher:
+    # 結果ファイルが揃い, 2 回続けて大きさと更新時刻が変わらなければ完了とみなす
+    def __init__(self, allFileList, resultDir=RESULT_DIR):
+        self.pendingFileList = list(allFileList)
+        self.resultDir = resultDir
+        self.outputFileDict = {}
+        self.stampDict = {}
+
+    def getResultFileList(self, datFileName):
+        if datFileName not in self.outputFileDict:
+            self.outputFileDict[datFileName] = DatData(datFileName).config["outputFile"].strip()
+        outputFileName = self.outputFileDict[datFileName]
+        return [os.path.join(self.resultDir, prefix + outputFileName) for prefix in RESULT_PREFIX_LIST]
+
+    def getStamp(self, datFileName):
+        stamp = []
+        for fileName in self.getResultFileList(datFileName):
+            if os.path.isfile(fileName):
+                stat = os.stat(fileName)
+                stamp.append((fileName, stat.st_size, stat.st_mtime_ns))
+        return stamp
+
+    def poll(self):
+        readyFileList = []
+        for datFileName in self.pendingFileList:
+            if not os.path.isfile(self.getResultFileList(datFileName)[0]):
+                continue
+            stamp = self.getStamp(datFileName)
+            if self.stampDict.get(datFileName) == stamp:
+                readyFileList.append(datFileName)
+            else:
+                self.stampDict[datFileName] = stamp
+        for datFileName in readyFileList:
+            self.pendingFileList.remove(datFileName)
+        return readyFileList
+
+    def isFinished(self):
+        return len(self.pendingFileList) == 0
+
+
+class Pipeline:
+    # 設定ごとに結果が揃った時点で読み込み, 揃った分だけで図を描き直す
+    def __init__(self, allFileList, workerNum=analyzeMain.WORKER_NUM, streaming=analyzeMain.STREAMING,
+                 keepSteps=analyzeMain.KEEP_STEPS):
+        self.allFileList = allFileList
+        self.workerNum = workerNum
+        self.streaming = streaming
+        self.keepSteps = keepSteps
+        self.cache = DataCache(options={"streaming": streaming, "keepSteps": keepSteps})
+        self.cache.evict(allFileList)
+        self.dataDict = {}
+
+    def ingest(self, datFileList):
+        for datFileName in datFileList:
+            data = self.cache.load(datFileName)
+            if data is None:
+                data = AllData(datFileName, self.streaming, self.keepSteps)
+                self.cache.store(datFileName, data)
+            self.dataDict[datFileName] = data
+            print("Ingest {} ({} / {})".format(datFileName, len(self.dataDict), len(self.allFileList)))
+
+        readyFileList = [fileName for fileName in self.allFileList if fileName in self.dataDict]
+        analyzer = Analyzer(self.dataDict, readyFileList, self.workerNum)
+        try:
+            analyzer.drawGraph()
+        finally:
+            self.cache.saveIndex()
+
+    def runWatch(self, pollInterval=POLL_INTERVAL):
+        watcher = ResultWatcher(self.allFileList)
+        while not watcher.isFinished():
+            readyFileList = watcher.poll()
+            if readyFileList:
+                self.ingest(readyFileList)
+            else:
+                time.sleep(pollInterval)
+
+    def runWithRunner(self, runner):
+        # runner は別 thread で動かし, 連結が終わった設定を queue で受け取る
+        mergedQueue = queue.Queue()
+        result = {}
+
+        def runSimulation():
+            result["failed"] = runner.run(onMerged=mergedQueue.put)
+
+        thread = threading.Thread(target=runSimulation)
+        thread.start()
+        while thread.is_alive() or not mergedQueue.empty():
+            try:
+                readyFileList = [mergedQueue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            while not mergedQueue.empty():
+                readyFileList.append(mergedQueue.get())
+            self.ingest(readyFileList)
+        thread.join()
+
+        return result.get("failed", [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze simulation results while they are produced")
+    parser.add_argument("--watch", action="store_true", help="only watch the result directory (simulations run elsewhere)")
+    parser.add_argument("--count", type=int, default=1000, help="runs per dat file")
+    parser.add_argument("--workers", type=int, default=0, help="parallel simulation runs (0 = cpu count)")
+    parser.add_argument("--analyze-workers", type=int, default=1, help="processes for parsing and rendering")
+    parser.add_argument("--ptime", action="store_true", help="pass -ptime to the simulator")
+    parser.add_argument("--poll", type=float, default=POLL_INTERVAL, help="seconds between result directory scans")
+    addAdaptiveArguments(parser)
+    args = parser.parse_args()
+
+    allFileList = natsorted(glob.glob(analyzeMain.DAT_PATH))
+    pipeline = Pipeline(allFileList, args.analyze_workers)
+    if args.watch:
+        pipeline.runWatch(args.poll)
+        return
+
+    runner = createRunner(args, allFileList)
+    if pipeline.runWithRunner(runner):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+
+VALUE_DTYPE = np.int64
+
+
+class RaggedArray:
+    # 可変長の行を flat な values と行ごとの offsets で持つ (CSR 形式)
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def getLengths(self):
+        return np.diff(self.offsets)
+
+    def getRowIndex(self):
+        return np.repeat(np.arange(len(self)), self.getLengths())
+
+
+def parseIntText(text, sep):
+    # 文字列の分割と数値変換を numpy の C 実装で一度に行う
+    if not text.strip():
+        return np.zeros(0, dtype=VALUE_DTYPE)
+    return np.fromstring(text, dtype=VALUE_DTYPE, sep=sep)
+
+
+def parseIntFile(fileName):
+    with open(fileName, 'r') as f:
+        return parseIntText(f.read(), ' ')
+
+
+def parseRaggedField(fieldList, sep='/', skipFirst=False):
+    # skipFirst は "x/a/b".split('/')[1:] と同じく最初の区切りまでを捨てる
+    fieldList = [field.strip() for field in fieldList]
+    if skipFirst:
+        fieldList = [field.partition(sep)[2] for field in fieldList]
+    lengths = np.fromiter((field.count(sep) + 1 if field else 0 for field in fieldList),
+                          dtype=VALUE_DTYPE, count=len(fieldList))
+    offsets = np.zeros(len(fieldList) + 1, dtype=VALUE_DTYPE)
+    np.cumsum(lengths, out=offsets[1:])
+
+    values = parseIntText(sep.join(field for field in fieldList if field), sep)
+
+    return RaggedArray(values, offsets)
+
+
+def parseTable(fieldList, width, sep='/'):
+    # 各行が同じ個数の値を持つ列を (行数, width) の配列にする
+    values = parseIntText(sep.join(field.strip() for field in fieldList), sep)
+    return values.reshape(len(fieldList), width)
+
+
+def readLineFields(fileName, sep=','):
+    # 最後の列には改行が残る
+    with open(fileName, 'r') as f:
+        return [line.split(sep) for line in f]
+
+
+def concatRagged(raggedList):
+    # 行を順に並べた 1 つの RaggedArray にする
+    offsetsList = [np.zeros(1, dtype=VALUE_DTYPE)]
+    start = 0
+    for ragged in raggedList:
+        offsetsList.append(np.asarray(ragged.offsets[1:], dtype=VALUE_DTYPE) - ragged.offsets[0] + start)
+        start += ragged.offsets[-1] - ragged.offsets[0]
+    values = np.concatenate([np.asarray(ragged.values[ragged.offsets[0]:ragged.offsets[-1]]) for ragged in raggedList]
+                            + [np.zeros(0, dtype=VALUE_DTYPE)])
+    return RaggedArray(values, np.concatenate(offsetsList))
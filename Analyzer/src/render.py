@@ -0,0 +1,141 @@
+import os
+import json
+import hashlib
+from multiprocessing import Pool
+import numpy as np
+from loader import defineWorkerNum
+
+# 描画のコードを変えたら上げる. 全ての図が描き直される
+RENDER_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+BAND_ALPHA = 0.2
+
+
+class FigureSpec:
+    # 描画に必要なデータとラベルだけを持つ. pickle して worker に渡す
+    def __init__(self, figName, xlabel, ylabel):
+        self.figName = figName
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.lines = []
+        self.xticks = None
+        self.legendLoc = None
+        self.isMath = False
+
+    def addLine(self, X, Y, color, linestyle, label=None, band=None):
+        # band は (下限, 上限) で, 線の周りを塗る
+        self.lines.append({"X": X, "Y": Y, "color": color, "linestyle": linestyle, "label": label, "band": band})
+
+    def getFingerprint(self):
+        import matplotlib
+        sha = hashlib.sha1()
+
+        def update(value):
+            if isinstance(value, (list, tuple, np.ndarray)):
+                array = np.ascontiguousarray(np.asarray(value))
+                sha.update("{}{}".format(array.dtype.str, array.shape).encode())
+                sha.update(array.tobytes())
+            else:
+                sha.update(repr(value).encode())
+            sha.update(b"|")
+
+        for value in [RENDER_VERSION, matplotlib.__version__, self.xlabel, self.ylabel,
+                      self.xticks, self.legendLoc, self.isMath]:
+            update(value)
+        for line in self.lines:
+            for key in ["X", "Y", "color", "linestyle", "label"]:
+                update(line[key])
+            if line["band"] is not None:
+                update(line["band"])
+
+        return sha.hexdigest()
+
+
+class FigureManifest:
+    # ディレクトリごとに {図のファイル名: fingerprint} を保存しておく
+    def __init__(self, dirName):
+        self.fileName = os.path.join(dirName, MANIFEST_FILE)
+        self.fingerprints = {}
+        if os.path.isfile(self.fileName):
+            with open(self.fileName, 'r') as f:
+                self.fingerprints = json.load(f)
+
+    def isUpToDate(self, figName, fingerprint):
+        return os.path.isfile(figName) and self.fingerprints.get(os.path.basename(figName)) == fingerprint
+
+    def update(self, figName, fingerprint):
+        self.fingerprints[os.path.basename(figName)] = fingerprint
+
+    def save(self):
+        with open(self.fileName, 'w') as f:
+            json.dump(self.fingerprints, f, indent=1, sort_keys=True)
+
+
+def renderFigure(spec):
+    # pyplot の状態を使わず Agg の Figure に直接描く
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib import ticker
+
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+
+    for line in spec.lines:
+        ax.plot(line["X"], line["Y"], color=line["color"], label=line["label"], markersize="5", linestyle=line["linestyle"])
+        if line["band"] is not None:
+            ax.fill_between(line["X"], line["band"][0], line["band"][1], color=line["color"], alpha=BAND_ALPHA, linewidth=0)
+
+    if spec.xticks is not None:
+        ax.set_xticks(spec.xticks)
+    if spec.legendLoc is not None:
+        ax.legend(loc=spec.legendLoc)
+
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    ax.grid(True)
+
+    if spec.isMath:
+        ax.yaxis.set_major_formatter(ticker.ScalarFormatter(useMathText=True))
+        ax.ticklabel_format(style="sci", axis="y", scilimits=(0, 0))
+
+    fig.savefig(spec.figName)
+    return spec.figName
+
+
+def renderFigures(specList, workerNum=None, force=False):
+    # (figName, 描いたかどうか) を返す. fingerprint が変わらない図は描かない
+    manifestDict = {}
+    fingerprintDict = {}
+    renderSpecList = []
+    for spec in specList:
+        dirName = os.path.dirname(spec.figName)
+        if dirName not in manifestDict:
+            manifestDict[dirName] = FigureManifest(dirName)
+        fingerprint = spec.getFingerprint()
+        if not force and manifestDict[dirName].isUpToDate(spec.figName, fingerprint):
+            yield spec.figName, False
+            continue
+        fingerprintDict[spec.figName] = fingerprint
+        renderSpecList.append(spec)
+
+    try:
+        for figName in iterRenderFigure(renderSpecList, workerNum):
+            manifestDict[os.path.dirname(figName)].update(figName, fingerprintDict[figName])
+            yield figName, True
+    finally:
+        for manifest in manifestDict.values():
+            manifest.save()
+
+
+def iterRenderFigure(specList, workerNum=None):
+    # 描き終わった順に figName を返す
+    workerNum = defineWorkerNum(workerNum, len(specList))
+    if workerNum == 1:
+        for spec in specList:
+            yield renderFigure(spec)
+        return
+
+    with Pool(workerNum) as pool:
+        for figName in pool.imap_unordered(renderFigure, specList):
+            yield figName
@@ -0,0 +1,320 @@
+import os
+import sys
+import glob
+import shutil
+import argparse
+import subprocess
+from multiprocessing.pool import ThreadPool
+import numpy as np
+from natsort import natsorted
+from cache import calcFileHash
+from data import RESULT_DIR, DatData, countCollisionPerRun, countRetransmissionPerRun
+from loader import defineWorkerNum
+from ragged import parseIntFile, parseRaggedField, readLineFields
+from stats import RunningStats, bootstrapInterval, normalInterval
+
+DAT_PATH = '../dat/*.dat'
+JAR_FILE = 'my_sim.jar'
+SCRATCH_DIR = '../scratch'
+DONE_FILE = 'done'
+HASH_FILE = 'dat_hash'
+LOG_FILE = 'stdout.log'
+# adaptive mode の既定値
+BATCH_SIZE = 100
+CONFIDENCE = 0.95
+MEDIAN_RESAMPLE_NUM = 1000
+
+
+class SimulationRunner:
+    # 1 回の実行ごとに scratch/<dat>/run_<i> で java を動かし, 設定ごとに run の順で結果を連結する
+    def __init__(self, datFileList, count, workerNum=None, isPtime=False,
+                 scratchDir=SCRATCH_DIR, resultDir=RESULT_DIR, jarFile=JAR_FILE):
+        self.datFileList = datFileList
+        self.count = count
+        self.workerNum = workerNum
+        self.isPtime = isPtime
+        self.scratchDir = scratchDir
+        self.resultDir = resultDir
+        self.jarFile = os.path.abspath(jarFile)
+
+    def defineConfigDir(self, datFileName):
+        return os.path.join(self.scratchDir, os.path.basename(datFileName))
+
+    def defineRunDir(self, datFileName, runIndex):
+        return os.path.join(self.defineConfigDir(datFileName), "run_{}".format(runIndex))
+
+    def isDone(self, datFileName, runIndex):
+        return os.path.isfile(os.path.join(self.defineRunDir(datFileName, runIndex), DONE_FILE))
+
+    def prepareConfigDir(self, datFileName):
+        # dat の中身が変わっていたら前回の実行結果は使わない
+        configDir = self.defineConfigDir(datFileName)
+        hashFileName = os.path.join(configDir, HASH_FILE)
+        datHash = calcFileHash(datFileName)
+        if os.path.isfile(hashFileName):
+            with open(hashFileName, 'r') as f:
+                if f.read().strip() == datHash:
+                    return
+            shutil.rmtree(configDir)
+        os.makedirs(configDir, exist_ok=True)
+        with open(hashFileName, 'w') as f:
+            f.write(datHash)
+
+    def createCommand(self, datFileName):
+        command = ["java", "-jar", self.jarFile, "-pfile:", os.path.abspath(datFileName), "-batchRun"]
+        if self.isPtime:
+            command.append("-ptime")
+        return command
+
+    def runOnce(self, job):
+        datFileName, runIndex = job
+        runDir = self.defineRunDir(datFileName, runIndex)
+        # 途中で止まった run は最初からやり直す
+        if os.path.isdir(runDir):
+            shutil.rmtree(runDir)
+        os.makedirs(runDir)
+
+        with open(os.path.join(runDir, LOG_FILE), 'w') as log:
+            returnCode = subprocess.call(self.createCommand(datFileName), cwd=runDir,
+                                         stdout=log, stderr=subprocess.STDOUT)
+        if returnCode == 0:
+            open(os.path.join(runDir, DONE_FILE), 'w').close()
+        return datFileName, runIndex, returnCode
+
+    def createJobList(self):
+        jobList = []
+        for datFileName in self.datFileList:
+            self.prepareConfigDir(datFileName)
+            for runIndex in range(1, self.count + 1):
+                if not self.isDone(datFileName, runIndex):
+                    jobList.append((datFileName, runIndex))
+        return jobList
+
+    def mergeResult(self, datFileName, runNum):
+        # run_1, run_2, ... の順に同じ名前のファイルを連結する
+        outputFileNameList = []
+        for runIndex in range(1, runNum + 1):
+            runDir = self.defineRunDir(datFileName, runIndex)
+            for fileName in natsorted(glob.glob(os.path.join(runDir, "*.txt"))):
+                if os.path.basename(fileName) not in outputFileNameList:
+                    outputFileNameList.append(os.path.basename(fileName))
+
+        os.makedirs(self.resultDir, exist_ok=True)
+        for outputFileName in outputFileNameList:
+            tmpFileName = os.path.join(self.resultDir, outputFileName + ".tmp")
+            with open(tmpFileName, 'w') as out:
+                for runIndex in range(1, runNum + 1):
+                    fileName = os.path.join(self.defineRunDir(datFileName, runIndex), outputFileName)
+                    if os.path.isfile(fileName):
+                        with open(fileName, 'r') as f:
+                            out.write(f.read())
+            os.replace(tmpFileName, os.path.join(self.resultDir, outputFileName))
+
+        return outputFileNameList
+
+    def mergeConfig(self, datFileName, onMerged=None, runNum=None):
+        if runNum is None:
+            runNum = self.count
+        for outputFileName in self.mergeResult(datFileName, runNum):
+            print("Merge {} runs into {}".format(runNum, os.path.join(self.resultDir, outputFileName)))
+        if onMerged is not None:
+            onMerged(datFileName)
+
+    def run(self, onMerged=None):
+        # 設定ごとに全ての run が終わった時点で結果を連結し, onMerged(datFileName) を呼ぶ
+        jobList = self.createJobList()
+        print("{} runs to execute ({} already done)".format(len(jobList), len(self.datFileList) * self.count - len(jobList)))
+
+        remainDict = {datFileName: 0 for datFileName in self.datFileList}
+        for datFileName, runIndex in jobList:
+            remainDict[datFileName] += 1
+        for datFileName in self.datFileList:
+            if remainDict[datFileName] == 0:
+                self.mergeConfig(datFileName, onMerged)
+
+        failedJobList = []
+        failedDatSet = set()
+        workerNum = defineWorkerNum(self.workerNum, len(jobList))
+        with ThreadPool(workerNum) as pool:
+            count = 1
+            for datFileName, runIndex, returnCode in pool.imap_unordered(self.runOnce, jobList):
+                status = "done" if returnCode == 0 else "failed ({})".format(returnCode)
+                print("{} / {} - {} run {} {}".format(count, len(jobList), os.path.basename(datFileName), runIndex, status))
+                if returnCode != 0:
+                    failedJobList.append((datFileName, runIndex))
+                    failedDatSet.add(datFileName)
+                remainDict[datFileName] -= 1
+                if remainDict[datFileName] == 0 and datFileName not in failedDatSet:
+                    self.mergeConfig(datFileName, onMerged)
+                count += 1
+
+        for datFileName in self.datFileList:
+            if datFileName in failedDatSet:
+                print("Skip merging {}: some runs failed, run again to resume".format(datFileName))
+
+        return failedJobList
+
+
+class ConvergenceTracker:
+    # run ごとの出力を読んで統計量を更新し, 信頼区間の相対幅で収束を判定する
+    # RTT の平均と中央値, run ごとの衝突数と再送数の平均を見る
+    def __init__(self, outputFileName, confidence=CONFIDENCE):
+        self.outputFileName = outputFileName
+        self.confidence = confidence
+        self.runNum = 0
+        self.rttList = []
+        self.statsDict = {"mean": RunningStats(), "collision": RunningStats(), "retransmission": RunningStats()}
+
+    def addRun(self, runDir):
+        self.runNum += 1
+        fileName = os.path.join(runDir, "batch_" + self.outputFileName)
+        if os.path.isfile(fileName):
+            steps = parseIntFile(fileName)
+            self.rttList.append(steps)
+            self.statsDict["mean"].update(steps)
+
+        fileName = os.path.join(runDir, "collision_batch_" + self.outputFileName)
+        if os.path.isfile(fileName):
+            collisionStep = parseRaggedField([datas[0] for datas in readLineFields(fileName)])
+            self.statsDict["collision"].update(countCollisionPerRun(collisionStep))
+
+        fileName = os.path.join(runDir, "retransmission_batch_" + self.outputFileName)
+        if os.path.isfile(fileName):
+            self.statsDict["retransmission"].update(countRetransmissionPerRun(readLineFields(fileName)))
+
+    def calcRelativeWidth(self, lower, upper, center):
+        if np.isnan(lower) or np.isnan(upper):
+            return float('inf')
+        if center == 0:
+            return 0.0 if upper == lower else float('inf')
+        return (upper - lower) / abs(center)
+
+    def getWidthDict(self):
+        widthDict = {}
+        for name, stats in self.statsDict.items():
+            if stats.count == 0:
+                continue
+            lower, upper = normalInterval(stats.mean, stats.getStd(ddof=1), stats.count, self.confidence)
+            widthDict[name] = self.calcRelativeWidth(lower, upper, stats.mean)
+
+        if self.rttList:
+            steps = np.concatenate(self.rttList)
+            self.rttList = [steps]
+            lower, upper = bootstrapInterval(steps, "median", self.confidence, MEDIAN_RESAMPLE_NUM)
+            widthDict["median"] = self.calcRelativeWidth(lower, upper, np.median(steps))
+
+        return widthDict
+
+    def isConverged(self, targetWidth, widthDict=None):
+        if widthDict is None:
+            widthDict = self.getWidthDict()
+        return len(widthDict) > 0 and all(width <= targetWidth for width in widthDict.values())
+
+
+class AdaptiveRunner(SimulationRunner):
+    # batchSize 回ずつ実行し, 全ての指標の信頼区間の相対幅が targetWidth 以下になった設定から止める
+    # count は設定ごとの上限. 1 batch 分を全ての設定で終えてから判定する
+    def __init__(self, datFileList, count, targetWidth, batchSize=BATCH_SIZE, minRunNum=None,
+                 confidence=CONFIDENCE, workerNum=None, isPtime=False,
+                 scratchDir=SCRATCH_DIR, resultDir=RESULT_DIR, jarFile=JAR_FILE):
+        super().__init__(datFileList, count, workerNum, isPtime, scratchDir, resultDir, jarFile)
+        self.targetWidth = targetWidth
+        self.batchSize = batchSize
+        self.minRunNum = batchSize if minRunNum is None else minRunNum
+        self.confidence = confidence
+
+    def createBatchJobList(self, datFileName, start, end):
+        return [(datFileName, runIndex) for runIndex in range(start + 1, end + 1)
+                if not self.isDone(datFileName, runIndex)]
+
+    def run(self, onMerged=None):
+        trackerDict = {}
+        runNumDict = {}
+        for datFileName in self.datFileList:
+            self.prepareConfigDir(datFileName)
+            trackerDict[datFileName] = ConvergenceTracker(DatData(datFileName).config["outputFile"].strip(), self.confidence)
+            runNumDict[datFileName] = 0
+
+        activeList = list(self.datFileList)
+        failedJobList = []
+        failedDatSet = set()
+        workerNum = defineWorkerNum(self.workerNum, len(self.datFileList) * self.batchSize)
+        with ThreadPool(workerNum) as pool:
+            while activeList:
+                endDict = {datFileName: min(runNumDict[datFileName] + self.batchSize, self.count) for datFileName in activeList}
+                jobList = []
+                for datFileName in activeList:
+                    jobList += self.createBatchJobList(datFileName, runNumDict[datFileName], endDict[datFileName])
+
+                count = 1
+                for datFileName, runIndex, returnCode in pool.imap_unordered(self.runOnce, jobList):
+                    status = "done" if returnCode == 0 else "failed ({})".format(returnCode)
+                    print("{} / {} - {} run {} {}".format(count, len(jobList), os.path.basename(datFileName), runIndex, status))
+                    if returnCode != 0:
+                        failedJobList.append((datFileName, runIndex))
+                        failedDatSet.add(datFileName)
+                    count += 1
+
+                for datFileName in list(activeList):
+                    if datFileName in failedDatSet:
+                        activeList.remove(datFileName)
+                        continue
+                    tracker = trackerDict[datFileName]
+                    for runIndex in range(runNumDict[datFileName] + 1, endDict[datFileName] + 1):
+                        tracker.addRun(self.defineRunDir(datFileName, runIndex))
+                    runNumDict[datFileName] = endDict[datFileName]
+
+                    widthDict = tracker.getWidthDict()
+                    widthText = ", ".join("{} {:.4f}".format(name, width) for name, width in sorted(widthDict.items()))
+                    isConverged = runNumDict[datFileName] >= self.minRunNum and tracker.isConverged(self.targetWidth, widthDict)
+                    if isConverged or runNumDict[datFileName] >= self.count:
+                        reason = "converged" if isConverged else "reached the cap"
+                        print("{} {} after {} runs ({})".format(os.path.basename(datFileName), reason, runNumDict[datFileName], widthText))
+                        self.mergeConfig(datFileName, onMerged, runNumDict[datFileName])
+                        activeList.remove(datFileName)
+                    else:
+                        print("{} not converged after {} runs ({})".format(os.path.basename(datFileName), runNumDict[datFileName], widthText))
+
+        for datFileName in self.datFileList:
+            if datFileName in failedDatSet:
+                print("Skip merging {}: some runs failed, run again to resume".format(datFileName))
+
+        return failedJobList
+
+
+def createRunner(args, datFileList, scratchDir=SCRATCH_DIR, resultDir=RESULT_DIR, jarFile=JAR_FILE):
+    # --rel-width を指定した時だけ adaptive mode にする. --count は設定ごとの上限になる
+    if args.rel_width is None:
+        return SimulationRunner(datFileList, args.count, args.workers, args.ptime, scratchDir, resultDir, jarFile)
+    return AdaptiveRunner(datFileList, args.count, args.rel_width, args.batch_size, args.min_runs,
+                          args.confidence, args.workers, args.ptime, scratchDir, resultDir, jarFile)
+
+
+def addAdaptiveArguments(parser):
+    parser.add_argument("--rel-width", type=float, default=None,
+                        help="stop a dat file once every confidence interval is narrower than this fraction of its estimate")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="runs per dat file between convergence checks")
+    parser.add_argument("--min-runs", type=int, default=None, help="runs before a dat file may stop (default = batch size)")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE, help="confidence level of the intervals")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run MolComSim batch runs in parallel")
+    parser.add_argument("--count", type=int, default=1000, help="runs per dat file (the cap with --rel-width)")
+    parser.add_argument("--workers", type=int, default=0, help="parallel runs (0 = cpu count)")
+    parser.add_argument("--ptime", action="store_true", help="pass -ptime to the simulator")
+    parser.add_argument("--dat", default=DAT_PATH, help="glob of dat files")
+    parser.add_argument("--scratch", default=SCRATCH_DIR, help="directory for per-run outputs")
+    parser.add_argument("--result", default=RESULT_DIR, help="directory for merged batch files")
+    parser.add_argument("--jar", default=JAR_FILE, help="simulator jar")
+    addAdaptiveArguments(parser)
+    args = parser.parse_args()
+
+    runner = createRunner(args, natsorted(glob.glob(args.dat)), args.scratch, args.result, args.jar)
+    failedJobList = runner.run()
+    if failedJobList:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
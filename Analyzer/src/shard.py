@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import glob
+import time
+import pickle
+import shutil
+import socket
+import argparse
+import hashlib
+from natsort import natsorted
+from analyzer import Analyzer
+from cache import DataCache, CACHE_VERSION, calcFileHash, getSourceFileList
+from data import AllData
+import main as analyzeMain
+
+# 1 台で読んだ結果の store を設定と run の範囲ごとにまとめた shard. 中身は次のとおり
+#   shard.json                 : 設定 (dat の hash) ごとの run の範囲と結果ファイルの hash
+#   <configKey>_<dat>/         : AllData.saveStore の列と meta.pickle
+# merge は結果ファイルを読み直さずに列をつなぎ, 統計量と sketch を合成する
+SHARD_FILE = 'shard.json'
+META_FILE = 'meta.pickle'
+SHARD_VERSION = 1
+CONFIG_KEY_LENGTH = 12
+
+
+def calcContentHash(fileList):
+    # run の範囲が同じ shard が同じ結果から作られたかを見る
+    sha = hashlib.sha1()
+    for fileName in fileList:
+        sha.update(os.path.basename(fileName).encode())
+        sha.update((calcFileHash(fileName) if os.path.isfile(fileName) else "-").encode())
+    return sha.hexdigest()
+
+
+def defineEntryDir(shardDir, entry):
+    return os.path.join(shardDir, "{}_{}".format(entry["configKey"][:CONFIG_KEY_LENGTH], os.path.basename(entry["datFile"])))
+
+
+def writeEntry(shardDir, entry, data):
+    entryDir = defineEntryDir(shardDir, entry)
+    if os.path.isdir(entryDir):
+        shutil.rmtree(entryDir)
+    os.makedirs(entryDir)
+    meta = data.saveStore(entryDir)
+    with open(os.path.join(entryDir, META_FILE), 'wb') as f:
+        pickle.dump(meta, f)
+
+
+def readEntry(shardDir, entry, options):
+    entryDir = defineEntryDir(shardDir, entry)
+    with open(os.path.join(entryDir, META_FILE), 'rb') as f:
+        meta = pickle.load(f)
+    return AllData.fromStore(entry["datFile"], entryDir, meta, **options)
+
+
+def writeShardFile(shardDir, shard):
+    with open(os.path.join(shardDir, SHARD_FILE), 'w') as f:
+        json.dump(shard, f, indent=2)
+
+
+def readShardFile(shardDir):
+    fileName = os.path.join(shardDir, SHARD_FILE)
+    if not os.path.isfile(fileName):
+        print("Not Found {}".format(fileName))
+        sys.exit(1)
+    with open(fileName, 'r') as f:
+        shard = json.load(f)
+    if shard.get("version") != SHARD_VERSION or shard.get("cacheVersion") != CACHE_VERSION:
+        print("Cannot read {}: shard version {} / cache version {} (expected {} / {})".format(
+            shardDir, shard.get("version"), shard.get("cacheVersion"), SHARD_VERSION, CACHE_VERSION))
+        sys.exit(1)
+    return shard
+
+
+def createShardInfo(options, host, entries):
+    return {"version": SHARD_VERSION, "cacheVersion": CACHE_VERSION, "options": options, "host": host,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "entries": entries}
+
+
+def createShard(shardDir, allFileList, runStart, host, workerNum, streaming, keepSteps=False):
+    # この host の ../result を読み (cache にあればそれを使い), 全ての結果を shardDir に書き出す
+    options = {"streaming": streaming, "keepSteps": keepSteps}
+    cache = DataCache(options=options)
+    dataDict = analyzeMain.createDataDict(allFileList, cache, workerNum, streaming, keepSteps)
+    if not os.path.isdir(shardDir):
+        os.makedirs(shardDir)
+
+    entries = []
+    try:
+        for fileName in allFileList:
+            data = dataDict[fileName]
+            data.detachStore()
+            runNum = int(data.resultData.getRunNum())
+            entry = {
+                "configKey": calcFileHash(fileName),
+                "datFile": fileName,
+                "outputFile": data.outputFileName,
+                "runStart": runStart,
+                "runEnd": runStart + runNum,
+                "runNum": runNum,
+                "contentHash": calcContentHash(getSourceFileList(fileName, data.outputFileName)[1:]),
+            }
+            writeEntry(shardDir, entry, data)
+            entries.append(entry)
+            print("{} runs [{}, {}) - {}".format(runNum, entry["runStart"], entry["runEnd"], fileName))
+    finally:
+        cache.saveIndex()
+    writeShardFile(shardDir, createShardInfo(options, host, entries))
+    print("Write shard to {} ({} configs)".format(shardDir, len(entries)))
+
+
+def planMerge(shardList):
+    # 設定ごとに run の範囲の順に並べ, 同じ範囲の重複は捨て, 重なりは止める
+    planDict = {}
+    for shardDir, shard in shardList:
+        for entry in shard["entries"]:
+            planDict.setdefault(entry["configKey"], []).append((shardDir, entry))
+
+    for configKey, partList in planDict.items():
+        partList.sort(key=lambda part: (part[1]["runStart"], part[1]["runEnd"]))
+        keptList = []
+        for shardDir, entry in partList:
+            if keptList:
+                lastDir, last = keptList[-1]
+                name = os.path.basename(entry["datFile"])
+                if (entry["runStart"], entry["runEnd"]) == (last["runStart"], last["runEnd"]):
+                    if entry["contentHash"] != last["contentHash"]:
+                        print("Conflict runs [{}, {}) of {} in {} and {}".format(
+                            entry["runStart"], entry["runEnd"], name, lastDir, shardDir))
+                        sys.exit(1)
+                    print("Skip duplicate runs [{}, {}) of {} in {}".format(entry["runStart"], entry["runEnd"], name, shardDir))
+                    continue
+                if entry["runStart"] < last["runEnd"]:
+                    print("Overlap runs [{}, {}) in {} and [{}, {}) in {} of {}".format(
+                        last["runStart"], last["runEnd"], lastDir, entry["runStart"], entry["runEnd"], shardDir, name))
+                    sys.exit(1)
+                if entry["runStart"] > last["runEnd"]:
+                    print("Warning: runs [{}, {}) of {} are missing".format(last["runEnd"], entry["runStart"], name))
+            keptList.append((shardDir, entry))
+        planDict[configKey] = keptList
+    return planDict
+
+
+def mergeShards(outputDir, shardDirList):
+    shardList = [(shardDir, readShardFile(shardDir)) for shardDir in shardDirList]
+    options = shardList[0][1]["options"]
+    for shardDir, shard in shardList[1:]:
+        if shard["options"] != options:
+            print("Cannot merge {} read with {} into shards read with {}".format(shardDir, shard["options"], options))
+            sys.exit(1)
+    if os.path.abspath(outputDir) in [os.path.abspath(shardDir) for shardDir in shardDirList]:
+        print("Output {} must differ from the input shards".format(outputDir))
+        sys.exit(1)
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    entries = []
+    for configKey, partList in planMerge(shardList).items():
+        shardDir, first = partList[0]
+        data = readEntry(shardDir, first, options)
+        data.detachStore()
+        for shardDir, entry in partList[1:]:
+            data.merge(readEntry(shardDir, entry, options))
+        entry = dict(first)
+        entry["runEnd"] = partList[-1][1]["runEnd"]
+        entry["runNum"] = sum(part[1]["runNum"] for part in partList)
+        if len(partList) > 1:
+            entry["contentHash"] = hashlib.sha1("".join(part[1]["contentHash"] for part in partList).encode()).hexdigest()
+        writeEntry(outputDir, entry, data)
+        entries.append(entry)
+        print("{} runs from {} shards - {}".format(entry["runNum"], len(partList), entry["datFile"]))
+
+    hosts = sorted(set(shard["host"] for _, shard in shardList))
+    writeShardFile(outputDir, createShardInfo(options, ",".join(hosts), entries))
+    print("Write merged shard to {} ({} configs)".format(outputDir, len(entries)))
+
+
+def loadShard(shardDir):
+    # Analyzer にそのまま渡せる dataDict と dat ファイルの一覧
+    shard = readShardFile(shardDir)
+    dataDict = {}
+    for entry in shard["entries"]:
+        dataDict[entry["datFile"]] = readEntry(shardDir, entry, shard["options"])
+    allFileList = natsorted(dataDict.keys())
+    return {fileName: dataDict[fileName] for fileName in allFileList}, allFileList, shard
+
+
+def printSummary(shardDir):
+    dataDict, allFileList, shard = loadShard(shardDir)
+    entryDict = {entry["datFile"]: entry for entry in shard["entries"]}
+    print("\t".join(["datFile", "runStart", "runEnd", "runNum", "mean", "std", "median"]))
+    for fileName in allFileList:
+        entry = entryDict[fileName]
+        resultData = dataDict[fileName].resultData
+        print("\t".join(str(value) for value in [fileName, entry["runStart"], entry["runEnd"], entry["runNum"],
+                                                 float(resultData.mean_), float(resultData.std_), float(resultData.med_)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create, merge and read shards of parsed MolComSim results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create = subparsers.add_parser("create", help="write the results of this host to a shard")
+    create.add_argument("shard", help="output shard directory")
+    create.add_argument("--run-start", type=int, default=0, help="index of the first run of this host in the whole sweep")
+    create.add_argument("--host", default=socket.gethostname(), help="name recorded in the shard")
+    create.add_argument("--dat", default=analyzeMain.DAT_PATH, help="glob of dat files")
+    create.add_argument("--workers", type=int, default=1, help="processes for parsing files that are not cached (0 = cpu count)")
+    create.add_argument("--streaming", action="store_true", help="read batch_ files in chunks (approximate median)")
+    create.add_argument("--keep-steps", action="store_true", help="keep every RTT when streaming (for MEDIAN/JITTER intervals)")
+
+    merge = subparsers.add_parser("merge", help="merge shards into a new shard")
+    merge.add_argument("output", help="output shard directory")
+    merge.add_argument("shards", nargs="+", help="input shard directories")
+
+    summary = subparsers.add_parser("summary", help="print the run range and step statistics of every config")
+    summary.add_argument("shard", help="shard directory")
+
+    plot = subparsers.add_parser("plot", help="draw graphs from a shard")
+    plot.add_argument("shard", help="shard directory")
+    plot.add_argument("--workers", type=int, default=1, help="processes for drawing (0 = cpu count)")
+    plot.add_argument("--jobs", default=None, help="JSON or YAML file listing the graphs to draw")
+    plot.add_argument("--job", action="append", default=[], help="graph to draw as x:y:label[:classify][:interval] (repeatable)")
+
+    args = parser.parse_args()
+    if args.command == "create":
+        allFileList = natsorted(glob.glob(args.dat))
+        if not allFileList:
+            print("No dat file matches {}".format(args.dat))
+            sys.exit(1)
+        createShard(args.shard, allFileList, args.run_start, args.host, args.workers, args.streaming, args.keep_steps)
+    elif args.command == "merge":
+        mergeShards(args.output, args.shards)
+    elif args.command == "summary":
+        printSummary(args.shard)
+    else:
+        dataDict, allFileList, shard = loadShard(args.shard)
+        Analyzer(dataDict, allFileList, args.workers).drawGraph(analyzeMain.createJobList(args))
+
+
+if __name__ == "__main__":
+    main()
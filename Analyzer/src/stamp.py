@@ -0,0 +1,44 @@
+import os
+import hashlib
+
+# 結果ファイルが読んだ時から変わったかを size, mtime, sha1 で調べる
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def calcFileHash(fileName):
+    sha = hashlib.sha1()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class FileStamp:
+    def __init__(self, fileName, withHash=True):
+        self.fileName = fileName
+        self.exists = os.path.isfile(fileName)
+        self.size = None
+        self.mtime = None
+        self.hash = None
+        if self.exists:
+            stat = os.stat(fileName)
+            self.size = stat.st_size
+            self.mtime = stat.st_mtime_ns
+            if withHash:
+                self.hash = calcFileHash(fileName)
+
+    def isSame(self, stamp):
+        # size, mtime が同じなら中身は読まない
+        if self.exists != stamp.exists:
+            return False
+        if not self.exists:
+            return True
+        if self.size != stamp.size:
+            return False
+        if self.mtime == stamp.mtime:
+            return True
+        # touch やコピーで mtime だけ変わった場合は hash で判定する
+        if calcFileHash(self.fileName) != stamp.hash:
+            return False
+        stamp.mtime = self.mtime
+        return True
@@ -0,0 +1,159 @@
+import os
+import math
+from statistics import NormalDist
+from multiprocessing import Pool
+import numpy as np
+
+# QuantileSketch の相対誤差. 推定した分位点は真の値 x に対して |推定 - x| <= SKETCH_ALPHA * x
+SKETCH_ALPHA = 0.005
+# bootstrap で一度に作る resample 行列の要素数の上限
+BOOTSTRAP_MAX_ELEMENTS = 20 * 1000 * 1000
+BOOTSTRAP_RESAMPLE_NUM = 2000
+STAT_FUNC_DICT = {"mean": np.mean, "median": np.median, "std": np.std}
+
+
+class RunningStats:
+    # chunk ごとに count, mean, 偏差平方和 (M2), min, max を合成する (Welford / Chan)
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        if len(values) == 0:
+            return
+        chunk = RunningStats()
+        chunk.count = len(values)
+        chunk.mean = float(np.mean(values))
+        chunk.m2 = float(np.sum((values - chunk.mean) ** 2))
+        chunk.min = values.min()
+        chunk.max = values.max()
+        self.merge(chunk)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def getVariance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return float('nan')
+        return self.m2 / (self.count - ddof)
+
+    def getStd(self, ddof=0):
+        return math.sqrt(self.getVariance(ddof))
+
+
+class QuantileSketch:
+    # 対数幅の bin に数える (DDSketch). メモリは値の桁数にだけ比例する
+    # 0 以下の値は 0 として数える
+    def __init__(self, alpha=SKETCH_ALPHA):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.count = 0
+        self.zeroCount = 0
+        self.offset = 0
+        self.binCount = np.zeros(0, dtype=np.int64)
+
+    def update(self, values):
+        values = np.asarray(values)
+        positive = values[values > 0]
+        self.zeroCount += len(values) - len(positive)
+        self.count += len(values)
+        if len(positive) == 0:
+            return
+        index = np.ceil(np.log(positive) / math.log(self.gamma)).astype(np.int64)
+        self.addBinCount(index.min(), np.bincount(index - index.min()))
+
+    def addBinCount(self, offset, binCount):
+        if len(self.binCount) == 0:
+            self.offset = offset
+            self.binCount = binCount.astype(np.int64)
+            return
+        start = min(self.offset, offset)
+        end = max(self.offset + len(self.binCount), offset + len(binCount))
+        merged = np.zeros(end - start, dtype=np.int64)
+        merged[self.offset - start:self.offset - start + len(self.binCount)] += self.binCount
+        merged[offset - start:offset - start + len(binCount)] += binCount
+        self.offset = start
+        self.binCount = merged
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different alpha")
+        self.count += other.count
+        self.zeroCount += other.zeroCount
+        if len(other.binCount) > 0:
+            self.addBinCount(other.offset, other.binCount)
+
+    def getRankValue(self, rank):
+        if rank < self.zeroCount:
+            return 0.0
+        cumulative = np.cumsum(self.binCount) + self.zeroCount
+        i = int(np.searchsorted(cumulative, rank, side='right'))
+        return 2 * self.gamma ** (i + self.offset) / (self.gamma + 1)
+
+    def getQuantile(self, q):
+        # np.percentile と同じく順位 q * (n - 1) の前後を線形補間する
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        lower = math.floor(rank)
+        upper = math.ceil(rank)
+        fraction = rank - lower
+        return self.getRankValue(lower) * (1 - fraction) + self.getRankValue(upper) * fraction
+
+    def getMedian(self):
+        return self.getQuantile(0.5)
+
+
+def bootstrapChunk(args):
+    values, statName, resampleNum, seed = args
+    rng = np.random.default_rng(seed)
+    index = rng.integers(0, len(values), size=(resampleNum, len(values)))
+    return STAT_FUNC_DICT[statName](values[index], axis=1)
+
+
+def bootstrapInterval(values, statName="mean", confidence=0.95, resampleNum=BOOTSTRAP_RESAMPLE_NUM,
+                      seed=0, workerNum=1):
+    # percentile bootstrap. resample 行列は BOOTSTRAP_MAX_ELEMENTS ごとに分けて作り, 2 つ以上なら workerNum の process で求める
+    # workerNum が None か 0 なら CPU 数だけ使う
+    values = np.asarray(values, dtype=float)
+    if len(values) < 2:
+        return float('nan'), float('nan')
+    chunkSize = max(1, min(resampleNum, BOOTSTRAP_MAX_ELEMENTS // len(values)))
+    chunkNumList = [min(chunkSize, resampleNum - start) for start in range(0, resampleNum, chunkSize)]
+    seedList = np.random.SeedSequence(seed).spawn(len(chunkNumList))
+    argsList = [(values, statName, chunkNum, chunkSeed) for chunkNum, chunkSeed in zip(chunkNumList, seedList)]
+
+    if workerNum is None or workerNum <= 0:
+        workerNum = os.cpu_count() or 1
+    if workerNum > 1 and len(argsList) > 1:
+        with Pool(min(workerNum, len(argsList))) as pool:
+            statList = pool.map(bootstrapChunk, argsList)
+    else:
+        statList = [bootstrapChunk(args) for args in argsList]
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.percentile(np.concatenate(statList), [100 * alpha, 100 * (1 - alpha)])
+    return float(lower), float(upper)
+
+
+def normalInterval(mean, std, count, confidence=0.95):
+    # 平均の正規近似の信頼区間. 標本を持たない streaming の結果に使う
+    if count < 2:
+        return float('nan'), float('nan')
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    halfWidth = z * std / math.sqrt(count)
+    return mean - halfWidth, mean + halfWidth
@@ -0,0 +1,37 @@
+import os
+import pickle
+import numpy as np
+from ragged import RaggedArray
+
+# 列ごとに 1 ファイル, 読むときは memory map で開く
+
+
+def saveColumn(dirName, name, value):
+    if isinstance(value, RaggedArray):
+        np.save(os.path.join(dirName, name + ".values.npy"), value.values)
+        np.save(os.path.join(dirName, name + ".offsets.npy"), value.offsets)
+        return {"kind": "ragged", "name": name}
+    elif isinstance(value, np.ndarray):
+        np.save(os.path.join(dirName, name + ".npy"), value)
+        return {"kind": "array", "name": name}
+    else:
+        with open(os.path.join(dirName, name + ".pickle"), 'wb') as f:
+            pickle.dump(value, f)
+        return {"kind": "pickle", "name": name}
+
+
+def loadColumn(dirName, column):
+    name = column["name"]
+    if column["kind"] == "ragged":
+        values = np.load(os.path.join(dirName, name + ".values.npy"), mmap_mode='r')
+        offsets = np.load(os.path.join(dirName, name + ".offsets.npy"), mmap_mode='r')
+        return RaggedArray(values, offsets)
+    elif column["kind"] == "array":
+        return np.load(os.path.join(dirName, name + ".npy"), mmap_mode='r')
+    else:
+        with open(os.path.join(dirName, name + ".pickle"), 'rb') as f:
+            return pickle.load(f)
+
+
+def isColumnValue(value):
+    return isinstance(value, (np.ndarray, RaggedArray, list))
@@ -0,0 +1,85 @@
+import os
+import numpy as np
+
+# benchmark 用に dat と 4 種類の batch ファイルを作る
+DUPLICATION_LEVEL = 3
+DISTANCE_STEP = 10
+MAX_SIMULATION_STEP = 100000
+
+DAT_TEMPLATE = """* synthetic configuration
+transmitter (0,0,0) 5 (5,0,0)
+receiver ({distance},0,0) 5 ({release},0,0)
+intermediateNode ({middle},0,0) 5 ({middle},0,0) ({middle},0,0)
+moleculeParams {duplication} INFO PASSIVE 1
+moleculeParams 1 ACK ACTIVE 1 2.0
+moleculeParams 100 NOISE 1
+microtubuleParams (0,0,0) ({distance},0,0)
+microtubuleParams (0,5,0) ({distance},5,0)
+probDRail 0.5
+stepLengthX 1
+stepLengthY 1
+stepLengthZ 1
+maxSimulationStep {maxStep}
+FEC None 1 1.0
+outputFile {outputFile}
+"""
+
+
+def joinSteps(steps, prefix=""):
+    return prefix + "/".join(map(str, steps.tolist()))
+
+
+def writeDatFile(fileName, distance, duplication, outputFile):
+    with open(fileName, 'w') as f:
+        f.write(DAT_TEMPLATE.format(distance=distance, release=distance - 5, middle=distance // 2,
+                                    duplication=duplication, maxStep=MAX_SIMULATION_STEP, outputFile=outputFile))
+
+
+def writeResultFiles(resultDir, outputFile, runNum, stepNum, rng):
+    with open(os.path.join(resultDir, "batch_" + outputFile), 'w') as f:
+        f.write("\n".join(map(str, rng.integers(100, MAX_SIMULATION_STEP, runNum).tolist())) + "\n")
+
+    # 衝突が無い run は "0,0/0/0/0/0"
+    with open(os.path.join(resultDir, "collision_batch_" + outputFile), 'w') as f:
+        for num in rng.poisson(stepNum, runNum):
+            steps = np.sort(rng.integers(1, MAX_SIMULATION_STEP, num))
+            typeNum = rng.multinomial(num, [0.2] * 5) if num > 0 else np.zeros(5, dtype=int)
+            f.write("{},{}\n".format(joinSteps(steps) if num > 0 else "0", joinSteps(typeNum)))
+
+    with open(os.path.join(resultDir, "retransmission_batch_" + outputFile), 'w') as f:
+        for num in rng.poisson(2, runNum):
+            flag = "F" if rng.random() < 0.05 else "S"
+            if num == 0:
+                f.write("{},0\n".format(flag))
+                continue
+            txSteps = np.sort(rng.integers(1, MAX_SIMULATION_STEP, num))
+            rxSteps = txSteps + rng.integers(1, 1000, num)
+            f.write("{},{},{},{}\n".format(flag, joinSteps(txSteps, "/"), joinSteps(txSteps, "/"), joinSteps(rxSteps, "/")))
+
+    with open(os.path.join(resultDir, "adjust_batch_" + outputFile), 'w') as f:
+        for num in rng.poisson(3, runNum) + 1:
+            steps = np.sort(rng.integers(1, MAX_SIMULATION_STEP, num))
+            tx = rng.integers(1, 20, num)
+            rx = rng.integers(1, 20, num)
+            f.write(",".join("{}/{}/{}".format(*triple) for triple in zip(steps.tolist(), tx.tolist(), rx.tolist())) + "\n")
+
+
+def generateSweep(rootDir, configNum, runNum, stepNum, seed=0):
+    # rootDir/dat と rootDir/result に configNum 個の設定を作る
+    rng = np.random.default_rng(seed)
+    datDir = os.path.join(rootDir, "dat")
+    resultDir = os.path.join(rootDir, "result")
+    os.makedirs(datDir, exist_ok=True)
+    os.makedirs(resultDir, exist_ok=True)
+
+    datFileList = []
+    for i in range(configNum):
+        distance = DISTANCE_STEP * (1 + i // DUPLICATION_LEVEL)
+        duplication = 1 + i % DUPLICATION_LEVEL
+        outputFile = "result_d{}_dup{}.txt".format(distance, duplication)
+        datFileName = os.path.join(datDir, "synthetic_{}.dat".format(i))
+        writeDatFile(datFileName, distance, duplication, outputFile)
+        writeResultFiles(resultDir, outputFile, runNum, stepNum, rng)
+        datFileList.append(datFileName)
+
+    return datFileList
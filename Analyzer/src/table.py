@@ -0,0 +1,240 @@
+import os
+import sys
+import csv
+from enum import Enum
+import numpy as np
+from analyzer import XValue, YValue, DATA_KEY_DICT
+from data import ConfigValue, MicrotubuleArray
+from instrument import timed
+
+# 表に入れる指標. 列名は enum の名前の小文字
+TABLE_X_VALUE_LIST = [XValue.DISTANCE, XValue.DUPLICATION]
+TABLE_Y_VALUE_LIST = [YValue.MEAN, YValue.MEDIAN, YValue.JITTER, YValue.COLLISION_NUM, YValue.RETRANSMISSION_NUM,
+                      YValue.ADJUST_NUM, YValue.FIRST_ADJUST_STEP]
+AGGREGATE_FUNC_LIST = ["mean", "sum", "count", "min", "max", "std"]
+
+
+def flattenValue(prefix, value, row):
+    # DatData.config の値を "transmitter.centerPosition.x" のような列に展開する
+    if isinstance(value, MicrotubuleArray):
+        row[prefix + ".count"] = len(value)
+        row[prefix + ".totalLength"] = float(np.sum(value.getLengths()))
+    elif isinstance(value, ConfigValue):
+        for name in type(value).__slots__:
+            if hasattr(value, name):
+                flattenValue(prefix + "." + name, getattr(value, name), row)
+    elif isinstance(value, list):
+        # moleculeParams は分子の種類ごとに列を分ける. 同じ種類が続けば番号を付ける
+        nameCountDict = {}
+        for i, item in enumerate(value):
+            name = item.typeOfMolecule.name if hasattr(item, "typeOfMolecule") else str(i)
+            nameCountDict[name] = nameCountDict.get(name, 0) + 1
+            if nameCountDict[name] > 1:
+                name += str(nameCountDict[name])
+            flattenValue(prefix + "." + name, item, row)
+    elif isinstance(value, Enum):
+        row[prefix] = value.name
+    elif isinstance(value, str):
+        row[prefix] = value.strip()
+    else:
+        row[prefix] = value
+
+
+def flattenConfig(config):
+    row = {}
+    for key, value in config.items():
+        flattenValue(key, value, row)
+    return row
+
+
+def isNumber(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def createColumn(values):
+    # 数値だけなら数値の配列, 欠けた値があれば float にして nan で埋める
+    if all(isNumber(value) for value in values):
+        return np.array(values)
+    if all(value is None or isNumber(value) for value in values):
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    return np.array(["" if value is None else str(value) for value in values], dtype=object)
+
+
+def parseColumn(values):
+    # CSV の文字列から型を戻す
+    for dtype in [np.int64, float]:
+        try:
+            return np.array([np.nan if value == "" else value for value in values], dtype=dtype)
+        except ValueError:
+            continue
+    return np.array(values, dtype=object)
+
+
+def factorize(column):
+    # 最初に出てきた順の一意な値と, 各行がその何番目か
+    uniques, firstIndex, inverse = np.unique(column, return_index=True, return_inverse=True)
+    order = np.argsort(firstIndex)
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return uniques[order], rank[inverse.ravel()]
+
+
+def aggregateCodes(codes, values, groupNum, func):
+    values = np.asarray(values, dtype=float)
+    count = np.bincount(codes, minlength=groupNum)
+    if func == "count":
+        return count
+    if func == "sum":
+        return np.bincount(codes, weights=values, minlength=groupNum)
+    if func in ["mean", "std"]:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.bincount(codes, weights=values, minlength=groupNum) / count
+            if func == "mean":
+                return mean
+            # 大きな値で桁落ちしないよう平均を引いてから 2 乗する
+            return np.sqrt(np.bincount(codes, weights=(values - mean[codes]) ** 2, minlength=groupNum) / count)
+    if func in ["min", "max"]:
+        result = np.full(groupNum, np.inf if func == "min" else -np.inf)
+        (np.minimum if func == "min" else np.maximum).at(result, codes, values)
+        return result
+    print("Not Define {} in aggregateCodes".format(func))
+    sys.exit(1)
+
+
+class SweepTable:
+    # 1 行 1 設定の列指向の表. 列は numpy 配列で, 行の順は dat ファイルの順
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        if not self.columns:
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def getColumnNames(self):
+        return list(self.columns.keys())
+
+    def select(self, mask):
+        return SweepTable({name: column[mask] for name, column in self.columns.items()})
+
+    def groupBy(self, keyNames, valueName, func="mean"):
+        # [(key1 の値, key2 の値, ...), ...] と集計値の配列を返す
+        uniquesList = []
+        codes = np.zeros(len(self), dtype=np.int64)
+        for name in keyNames:
+            uniques, keyCodes = factorize(self.columns[name])
+            uniquesList.append(uniques.tolist())
+            codes = codes * len(uniques) + keyCodes
+        groupCodes, codes = factorize(codes)
+        values = aggregateCodes(codes, self.columns[valueName], len(groupCodes), func)
+
+        keys = []
+        for groupCode in groupCodes.tolist():
+            key = []
+            for uniques in reversed(uniquesList):
+                groupCode, keyCode = divmod(groupCode, len(uniques))
+                key.append(uniques[keyCode])
+            keys.append(tuple(reversed(key)))
+        return keys, values
+
+    def pivot(self, xName, yName, labelName, func="mean"):
+        # Analyzer.getLabelValues と同じ形 (X, label ごとの Y, label) で返す. 無い組み合わせは nan
+        X, xCodes = factorize(self.columns[xName])
+        labels, labelCodes = factorize(self.columns[labelName])
+        cellNum = len(labels) * len(X)
+        codes = labelCodes * len(X) + xCodes
+        values = aggregateCodes(codes, self.columns[yName], cellNum, func)
+        counts = np.bincount(codes, minlength=cellNum)
+        Y = np.where(counts > 0, values, np.nan).reshape(len(labels), len(X))
+        return X.tolist(), Y, labels.tolist()
+
+    @timed("table.save")
+    def save(self, fileName):
+        # 拡張子で形式を決める (.csv, .npz, .parquet, .feather)
+        extension = os.path.splitext(fileName)[1]
+        if extension == ".csv":
+            with open(fileName, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(self.getColumnNames())
+                writer.writerows(zip(*[column.tolist() for column in self.columns.values()]))
+        elif extension == ".npz":
+            np.savez(fileName, **{name: column.astype(str) if column.dtype == object else column
+                                  for name, column in self.columns.items()})
+        elif extension in [".parquet", ".feather"]:
+            table = self.toArrowTable()
+            if extension == ".parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, fileName)
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, fileName)
+        else:
+            print("Not Define {} in SweepTable.save".format(extension))
+            sys.exit(1)
+
+    @classmethod
+    @timed("table.load")
+    def load(cls, fileName):
+        extension = os.path.splitext(fileName)[1]
+        if extension == ".csv":
+            with open(fileName, 'r', newline='') as f:
+                rows = list(csv.reader(f))
+            if not rows[1:]:
+                return cls({name: np.zeros(0) for name in rows[0]})
+            return cls({name: parseColumn(values) for name, values in zip(rows[0], zip(*rows[1:]))})
+        elif extension == ".npz":
+            with np.load(fileName) as f:
+                return cls({name: f[name].astype(object) if f[name].dtype.kind == 'U' else f[name] for name in f.files})
+        elif extension in [".parquet", ".feather"]:
+            requirePackage("pyarrow", fileName)
+            if extension == ".parquet":
+                import pyarrow.parquet as pq
+                table = pq.read_table(fileName)
+            else:
+                import pyarrow.feather as feather
+                table = feather.read_table(fileName)
+            return cls({name: createColumn(values) for name, values in table.to_pydict().items()})
+        else:
+            print("Not Define {} in SweepTable.load".format(extension))
+            sys.exit(1)
+
+    def toArrowTable(self):
+        requirePackage("pyarrow", "Parquet/Feather")
+        import pyarrow as pa
+        return pa.table({name: column.tolist() if column.dtype == object else column for name, column in self.columns.items()})
+
+    def toDataFrame(self):
+        requirePackage("pandas", "DataFrame")
+        import pandas as pd
+        return pd.DataFrame(self.columns, columns=self.getColumnNames())
+
+
+def requirePackage(packageName, usage):
+    try:
+        __import__(packageName)
+    except ImportError:
+        print("{} is required for {}".format(packageName, usage))
+        sys.exit(1)
+
+
+@timed("table.buildSweepTable")
+def buildSweepTable(analyzer, yValueList=TABLE_Y_VALUE_LIST, fileList=None):
+    # 指標は analyzer.index から取るので, 図を描いた後なら計算し直さない
+    if fileList is None:
+        fileList = analyzer.allFileList
+    for key in dict.fromkeys(DATA_KEY_DICT[yValue] for yValue in yValueList):
+        analyzer.prepareData(key)
+
+    rowList = [{"datFile": fileName, "outputFile": analyzer.dataDict[fileName].outputFileName} for fileName in fileList]
+    for value in TABLE_X_VALUE_LIST + list(yValueList):
+        valueDict = analyzer.index.getValueDict(value)
+        for row, fileName in zip(rowList, fileList):
+            row[value.name.lower()] = valueDict[fileName]
+    for row, fileName in zip(rowList, fileList):
+        row.update(flattenConfig(analyzer.dataDict[fileName].datData.config))
+
+    nameList = list(dict.fromkeys(name for row in rowList for name in row))
+    return SweepTable({name: createColumn([row.get(name) for row in rowList]) for name in nameList})
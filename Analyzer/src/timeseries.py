@@ -0,0 +1,82 @@
+import warnings
+import numpy as np
+
+# 帯に使う run 間の percentile
+TRANSITION_PERCENTILE = (10, 90)
+
+
+def calcRunHistogram(ragged, binStep, binNum=None):
+    # run ごとに binStep 幅で件数を数えた (run 数, binNum) の行列. bin i は (i * binStep, (i + 1) * binStep]
+    # 0 以下の step (衝突が無い run の 0 など) は数えない
+    values = ragged.values
+    rowIndex = ragged.getRowIndex()
+    isEvent = values > 0
+    if binNum is None:
+        binNum = int((values[isEvent].max() - 1) // binStep + 1) if isEvent.any() else 0
+    isEvent &= values <= binNum * binStep
+    flatIndex = rowIndex[isEvent] * binNum + (values[isEvent] - 1) // binStep
+    return np.bincount(flatIndex, minlength=len(ragged) * binNum).reshape(len(ragged), binNum).astype(np.int32)
+
+
+def calcRunLevel(stepRagged, levelRagged, binStep, binNum=None):
+    # run ごとに, 各 bin の右端の時点で最後に設定された値を並べた (run 数, binNum) の行列. 最初の設定より前は nan
+    steps = stepRagged.values
+    if binNum is None:
+        binNum = int((steps.max() - 1) // binStep + 1) if len(steps) > 0 else 0
+    if len(steps) == 0:
+        return np.full((len(stepRagged), binNum), np.nan)
+    edges = np.arange(1, binNum + 1, dtype=np.int64) * binStep
+    # (run, step) を 1 つの整数にして全ての run をまとめて二分探索する
+    width = max(int(steps.max()), binNum * binStep) + 1
+    keys = stepRagged.getRowIndex() * width + steps
+    order = np.argsort(keys, kind='stable')
+    queries = (np.arange(len(stepRagged), dtype=np.int64)[:, None] * width + edges[None, :]).ravel()
+    index = np.searchsorted(keys[order], queries, side='right') - 1
+    isSet = index >= np.repeat(stepRagged.offsets[:-1], binNum)
+    levels = np.where(isSet, levelRagged.values[order[np.maximum(index, 0)]], np.nan)
+    return levels.reshape(len(stepRagged), binNum)
+
+
+def resizeColumns(runHistogram, binNum):
+    # 足りない bin は 0 で埋め, 多い bin は捨てる
+    if runHistogram.shape[1] >= binNum:
+        return runHistogram[:, :binNum]
+    resized = np.zeros((runHistogram.shape[0], binNum), dtype=runHistogram.dtype)
+    resized[:, :runHistogram.shape[1]] = runHistogram
+    return resized
+
+
+class TransitionCurve:
+    # run ごとの binStep あたりの件数 (isLevel なら各時点の値) の平均と, run 間の percentile の帯. X は bin の右端
+    # isLevel の行列の nan (まだ値が無い run) は平均と percentile に含めない
+    def __init__(self, runMatrix, binStep, percentile=TRANSITION_PERCENTILE, isLevel=False):
+        self.binStep = binStep
+        self.isLevel = isLevel
+        self.runNum = runMatrix.shape[0]
+        self.X = np.arange(1, runMatrix.shape[1] + 1, dtype=int) * binStep
+        if self.runNum == 0:
+            self.mean = np.zeros(runMatrix.shape[1])
+            self.lower = self.mean
+            self.upper = self.mean
+            return
+        if isLevel:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                self.mean = np.nanmean(runMatrix, axis=0)
+                self.lower, self.upper = np.nanpercentile(runMatrix, percentile, axis=0)
+        else:
+            self.mean = runMatrix.mean(axis=0)
+            self.lower, self.upper = np.percentile(runMatrix, percentile, axis=0)
+
+    def pad(self, binNum):
+        # 最後の event より後は, 件数なら全ての run で 0 件, isLevel なら最後の値のまま
+        if len(self.X) >= binNum:
+            return self
+        curve = TransitionCurve.__new__(TransitionCurve)
+        curve.binStep = self.binStep
+        curve.isLevel = self.isLevel
+        curve.runNum = self.runNum
+        curve.X = np.arange(1, binNum + 1, dtype=int) * self.binStep
+        mode = 'edge' if self.isLevel and len(self.X) > 0 else 'constant'
+        curve.mean, curve.lower, curve.upper = [np.pad(values, (0, binNum - len(values)), mode=mode) for values in [self.mean, self.lower, self.upper]]
+        return curve